@@ -0,0 +1,123 @@
+"""
+    Benchmark of car following backends
+
+    python benchmark.py
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+from time import perf_counter
+
+import numpy as np
+
+from carfollow import SIGMA_A, U_I, W_I, K_X
+from fleet import FleetState, simulate
+from kernels import available_backends
+from messages import MessageScheduler, Msg2
+from noise import NoiseSource
+from recorder import RecordingPolicy
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+N_VEHICLES = (10, 100, 1000, 10000)
+N_STEPS = 960
+SPACING = (W_I + U_I) / (W_I * K_X) / 0.3  # Initial spacing at 30 % of capacity [m]
+EVERY = (1, 100, 1000)  # Recording decimations of the scheduled message case
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def run(
+    backend: str,
+    n_vehicles: int,
+    n_steps: int = N_STEPS,
+    seed: int = 1,
+    active: bool = False,
+    sigma: float = SIGMA_A,
+):
+    """
+        Simulate a platoon receiving the same tabulated message
+    """
+    noise = NoiseSource(n_vehicles - 1, sigma=sigma, rng=np.random.default_rng(seed))
+    fleet = FleetState(
+        np.flip(np.arange(n_vehicles) * SPACING), U_I, backend=backend, noise=noise
+    )
+    fleet.register_control_speed(np.arange(n_vehicles), Msg2(14000).tabulated)
+    if active:
+        fleet.enable_active_set()
+    lead_spd = Msg2(15000).tabulated
+    start = perf_counter()
+    for _ in range(n_steps):
+        fleet.step_evolution(control=lead_spd)
+    elapsed = perf_counter() - start
+    fleet.synchronize()
+    return elapsed, fleet
+
+
+def benchmark(n_vehicles: tuple = N_VEHICLES, n_steps: int = N_STEPS) -> dict:
+    """
+        Time per step [ms] for every backend and fleet size
+    """
+    backends = available_backends()
+    run(backends[-1], 2, 2)  # Compilation
+    results = {}
+    for n in n_vehicles:
+        fleets = {}
+        for backend in backends:
+            elapsed, fleets[backend] = run(backend, n, n_steps)
+            results[(backend, n)] = 1000 * elapsed / n_steps
+        same = all(np.array_equal(fleets["numpy"].x_t, f.x_t) for f in fleets.values())
+        line = " ".join(f"{b}: {results[(b, n)]:.4f} ms/step" for b in backends)
+        speedup = results[("numpy", n)] / results[(backends[-1], n)]
+        print(f"N={n:6d} {line} speed-up: {speedup:.1f}x identical: {same}")
+    return results
+
+
+def run_scheduled(active: bool, every: int, n_vehicles: int = 50, n_steps: int = 600):
+    """
+        Platoon where one vehicle accepts a message on the way (noise-free),
+        recorded one step out of every
+    """
+    noise = NoiseSource(n_vehicles - 1, sigma=0)
+    fleet = FleetState(np.flip(np.arange(n_vehicles) * SPACING), U_I, noise=noise)
+    if active:
+        fleet.enable_active_set()
+    scheduler = MessageScheduler()
+    scheduler.register(20, Msg2(8000).tabulated, position=6500)
+    simulate(fleet, n_steps, control=U_I, policy=RecordingPolicy(every=every), scheduler=scheduler)
+    fleet.synchronize()
+    return fleet
+
+
+def benchmark_active(n_vehicles: tuple = N_VEHICLES, n_steps: int = N_STEPS) -> dict:
+    """
+        Time per step [ms] of full and active set stepping (numpy, noise-free)
+        and largest position gap between both [m]
+    """
+    results = {}
+    for n in n_vehicles:
+        full, fleet = run("numpy", n, n_steps, sigma=0)
+        active, sparse = run("numpy", n, n_steps, active=True, sigma=0)
+        gap = np.abs(fleet.x_t - sparse.x_t).max()
+        results[n] = (1000 * full / n_steps, 1000 * active / n_steps, gap)
+        print(
+            f"N={n:6d} full: {results[n][0]:.4f} ms/step active set: {results[n][1]:.4f} ms/step "
+            f"awake at the end: {len(sparse._awake)} max gap: {gap:.1e} m"
+        )
+    for every in EVERY:
+        fleet, sparse = run_scheduled(False, every), run_scheduled(True, every)
+        gap = np.abs(fleet.x_t - sparse.x_t).max()
+        results["scheduled", every] = gap
+        print(f"Scheduled message, recording every {every:4d} steps max gap: {gap:.1e} m")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_active()
@@ -33,7 +33,6 @@ V_0 = 25  # 90 / 3.6
 S_0IDM = 2
 
 # Random component
-np.random.seed(1)
 SIGMA_A = 0.05
 
 # ==============================================================================
@@ -46,6 +45,8 @@ class CarFollowLaw(Vehicle):
         Generic Car Following Behavior
     """
 
+    rng = np.random  # Noise generator, set a np.random.Generator per run
+
     def __init__(
         self,
         x0: float,
@@ -262,7 +263,7 @@ class Tampere(CarFollowLaw):
         """
         if self.veh_lead:
             self.a = max(
-                A_MIN, min(self.acel() + np.random.normal(0, SIGMA_A), A_MAX)
+                A_MIN, min(self.acel() + self.rng.normal(0, SIGMA_A), A_MAX)
             )  # Car following
         else:
             self.vd = self.control
@@ -281,8 +282,17 @@ class IDM(CarFollowLaw):
 
     __slots__ = ["_b", "_delta", "_amax"]
 
-    def __init__(self, x0: float, v0: float, veh_lead=None, **kwargs) -> None:
-        super().__init__(x0, v0, veh_lead, self.__class__.__name__)
+    def __init__(
+        self, x0: float, v0: float, l0: float, veh_type: str = "HDV", veh_lead=None, **kwargs
+    ) -> None:
+        super().__init__(
+            x0=x0,
+            v0=v0,
+            l0=l0,
+            veh_type=veh_type,
+            veh_lead=veh_lead,
+            behavior=self.__class__.__name__,
+        )
         self.set_parameters(**kwargs)
 
     @property
@@ -334,9 +344,9 @@ class IDM(CarFollowLaw):
 
     def break_strategy(self) -> float:
         """
-            BS: v * dv / (2 (a*b)^(1/2))
+            BS: v * (v - vl) / (2 (a*b)^(1/2))
         """
-        return (self.v_t * self.dv) / (2 * sqrt(self.a_max * self.b))
+        return (self.v_t * -self.dv) / (2 * sqrt(self.a_max * self.b))
 
     def s_d(self) -> float:
         """
@@ -356,23 +366,32 @@ class IDM(CarFollowLaw):
         """
         return (self.s_d() / self.s) ** 2
 
-    def acel(self, vd) -> float:
+    def free_acc(self) -> float:
+        """
+            Free road term a (1 - (v/vd)^d)
+        """
+        return self.a_max * (1 - self.t1(self.vd))
+
+    def acel(self) -> float:
         """
-            Vehicle acceleration
+            Vehicle acceleration a (1 - (v/vd)^d - (sd/s)^2)
         """
-        return self.a_max * (1 - self.t1() - self.t2())
+        return self.a_max * (1 - self.t1(self.vd) - self.t2())
 
-    def car_following(self, vd: float) -> None:
+    def car_following(self) -> None:
         """ 
             Acceleration car following 
             
             Note: 
                 if leader 
-                    min(cong_acc, free_acc) -> Tampere
+                    a (1 - (v/vd)^d - (sd/s)^2) -> IDM
                 else 
-                    manual acceleration
+                    free road acceleration
         """
         if self.veh_lead:
-            self.a = self.acel(vd)  # Car following
+            self.a = max(
+                A_MIN, min(self.acel() + self.rng.normal(0, SIGMA_A), A_MAX)
+            )  # Car following
         else:
-            self.a = self.control  # Leader vehicle 2nd order
+            self.vd = self.control
+            self.a = max(A_MIN, min(self.free_acc(), A_MAX))
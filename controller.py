@@ -6,15 +6,23 @@
 # Imports
 # ==============================================================================
 
-from network import TrafficNetwork
-
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator
 
+import numpy as np
+
+from network import TrafficNetwork
+from vehicles import U_I
+from fleet import FleetState, NO_LEADER
+from kernels import DEFAULT_BACKEND
+from noise import NoiseSource
+
 # ==============================================================================
 # Constants
 # ==============================================================================
 
 T_TOTAL = 720  # Simulation time
+GHOST_X = np.inf  # Ghost leader position when the downstream lane is empty
 
 # ==============================================================================
 # Classes
@@ -49,12 +57,14 @@ class SimulationControl:
     def solve_merges(self) -> None:
         """ Solve potential merges for a network """
 
-    def run_simulation(self) -> None:
+    def run_simulation(self, control=0, workers: int = None, seed: int = None) -> None:
         """ Execute a traffic simulator"""
+        stepper = ParallelStepper(self.tfnet, workers=workers, seed=seed)
         for t in self.time_iterator:
             # self.solve_merges() # 1 link at a time
-            for link in self.tfnet:
-                link.evolve_step()
+            stepper.step_evolution(control)
+        stepper.update_vehicles()
+        stepper.close()
 
         # for t, u in zip(time, lead_acc):
         #     for veh in veh_list:
@@ -76,3 +86,109 @@ class SimulationControl:
     # T_ACCEPT = SHIFT_CONG - np.random.exponential(PERCEP_RADIOUS, N * 1000)
     # T_ACCEPT = T_ACCEPT[(T_ACCEPT > 0) & (T_ACCEPT < SHIFT_CONG)]
     # T_ACCEPT = np.random.choice(T_ACCEPT, N)
+
+
+class ParallelStepper:
+    """
+        Steps the lanes of a network in worker threads.
+
+        Each lane is a FleetState with its own noise stream. The head of a
+        lane follows a ghost vehicle (row 0) holding the state of the last
+        vehicle of the matching lane in the next link. Ghosts are the only
+        state exchanged between lanes, once per step between the shift and
+        the car following. Lanes of the last link follow the head control.
+
+        Kernels release the GIL with the numba backend, with numpy only the
+        array operations run concurrently.
+    """
+
+    def __init__(
+        self,
+        traffic_network: TrafficNetwork,
+        workers: int = None,
+        seed: int = None,
+        backend: str = DEFAULT_BACKEND,
+    ) -> None:
+        self.network = traffic_network
+        self.lanes = []  # TrafficLane of each fleet
+        self.fleets = []
+        self.ghosted = []  # Whether fleet row 0 is a ghost
+        links = list(traffic_network.link_order.items())
+        for k, (lk, lane_order) in enumerate(links):
+            downstream = links[k + 1][1] if k + 1 < len(links) else ()
+            for ln in lane_order:
+                lane = traffic_network[lk][ln]
+                fleet = FleetState.from_vehicles(list(lane.veh_list), backend=backend)
+                ghost = bool(downstream)
+                if ghost:
+                    fleet = FleetState.stack([FleetState([GHOST_X], U_I, backend=backend), fleet])
+                    fleet.offsets = np.array([0, len(fleet)])
+                    heads = np.flatnonzero(fleet.lead[1:] == NO_LEADER) + 1
+                    fleet.lead[heads[:1]] = 0
+                self.lanes.append(lane)
+                self.fleets.append(fleet)
+                self.ghosted.append(ghost)
+
+        # Boundary pairs (upstream fleet, downstream fleet, position offset)
+        self.boundary = []
+        first = np.cumsum([0] + [len(order) for _, order in links])
+        for k, (lk, lane_order) in enumerate(links[:-1]):
+            n_down = len(links[k + 1][1])
+            for i, ln in enumerate(lane_order):
+                length = traffic_network[lk][ln].length
+                self.boundary.append((first[k] + i, first[k + 1] + i % n_down, length))
+
+        seeds = np.random.SeedSequence(seed).spawn(len(self.fleets))
+        for fleet, ss in zip(self.fleets, seeds):
+            fleet.noise = NoiseSource(len(fleet.followers), rng=np.random.default_rng(ss))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __len__(self) -> int:
+        """ Number of lanes"""
+        return len(self.fleets)
+
+    def map(self, method: str) -> None:
+        """
+            Call a fleet method on every lane in the workers
+        """
+        list(self.executor.map(lambda fleet: getattr(fleet, method)(), self.fleets))
+
+    def exchange(self) -> None:
+        """
+            Copy the last vehicle of each downstream lane into its ghost
+        """
+        for up, down, length in self.boundary:
+            ghost, fleet = self.fleets[up], self.fleets[down]
+            tail = len(fleet) - 1
+            if tail < int(self.ghosted[down]):  # Empty downstream lane
+                ghost.x_t[0], ghost.v_t[0] = GHOST_X, U_I
+            else:
+                ghost.x_t[0], ghost.v_t[0] = fleet.x_t[tail] + length, fleet.v_t[tail]
+
+    def step_evolution(self, control=0) -> None:
+        """
+            Use this method to a single step in the simulation
+        """
+        self.map("shift_state")
+        self.exchange()
+        for fleet in self.fleets:
+            fleet.control = control
+        self.map("car_following")
+
+    def update_vehicles(self) -> None:
+        """
+            Write the lane states back into the vehicle objects
+        """
+        for lane, fleet, ghost in zip(self.lanes, self.fleets, self.ghosted):
+            for i, veh in enumerate(lane.veh_list, int(ghost)):
+                veh.x_t = fleet.x_t[i]
+                veh.v_t = fleet.v_t[i]
+                veh.a_t = fleet.a_t[i]
+                veh.a = fleet.a[i]
+                veh.control = fleet.control
+
+    def close(self) -> None:
+        """
+            Stop the workers
+        """
+        self.executor.shutdown()
@@ -8,6 +8,7 @@
 # ==============================================================================
 
 import collections.abc
+from functools import lru_cache
 
 import numpy as np
 
@@ -16,14 +17,64 @@ from bokeh.plotting import show
 from bokeh.layouts import row, column
 
 from carfollow import K_X, W_I, U_I
+from streams import spawn_streams
 
 # ==============================================================================
 # Constants
 # ==============================================================================
 
 C = U_I * W_I * K_X / (U_I + W_I) * 3600  # veh /h
+CHUNK_ARRIVALS = 4096  # Arrivals drawn at once by a demand stream
+DEMAND_CACHE = 64  # Maximum amount of memoized demand draws
+SEED = 42  # Demand stream used when no generator or seed is given
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def demand_rng(rng=None) -> np.random.Generator:
+    """ Generator given, or "demand" stream of spawn_streams(rng) (SEED when None)"""
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return spawn_streams(SEED if rng is None else rng)["demand"]
+
+
+def segment_sizes(flows: np.ndarray, durations: np.ndarray) -> np.ndarray:
+    """ Number of vehicles of each segment (as find_times_exponential)"""
+    flow_vm = np.clip(np.asarray(flows, dtype=float) / 60, 1, C / 60)
+    return (flow_vm * np.asarray(durations)).astype(int)
+
+
+def draw_headways(patterns: tuple, rng) -> list:
+    """ Time headways of several demand patterns ((flows, durations), ...)
+
+        A single exponential draw with one scale per vehicle, the values are
+        the ones of a loop calling find_times_exponential on each segment.
+    """
+    flows = np.concatenate([np.asarray(f, dtype=float) for f, _ in patterns])
+    durations = np.concatenate([np.asarray(d, dtype=float) for _, d in patterns])
+    sizes = segment_sizes(flows, durations)
+    headways = rng.exponential(np.repeat(3600 / flows, sizes))
+    bounds = np.cumsum([len(f) for f, _ in patterns])[:-1]
+    per_link = np.add.reduceat(sizes, np.concatenate(([0], bounds))) if len(sizes) else sizes
+    return np.split(headways, np.cumsum(per_link)[:-1])
+
+
+def headways_to_positions(time_headways: np.ndarray) -> np.ndarray:
+    """ Initial positions from time headways (first vehicle at 0)"""
+    return np.concatenate(([0], np.cumsum(time_headways * U_I)))
+
+
+@lru_cache(maxsize=DEMAND_CACHE)
+def cached_positions(patterns: tuple, seed) -> tuple:
+    """ Memoized initial positions of demand patterns (read-only arrays)"""
+    rng = spawn_streams(seed)["demand"]
+    positions = tuple(headways_to_positions(h) for h in draw_headways(patterns, rng))
+    for x in positions:
+        x.flags.writeable = False
+    return positions
 
-np.random.seed(35)  # Reproducibility Flow
 
 # ==============================================================================
 # Classes
@@ -33,38 +84,64 @@ np.random.seed(35)  # Reproducibility Flow
 class Demand:
     """ Demand for a single link not lane"""
 
-    def __init__(self, flow_values_vh=(C,), flow_duration_m=(1,), sim_time: int = 12):
+    def __init__(self, flow_values_vh=(C,), flow_duration_m=(1,), sim_time: int = 12, rng=None):
         self.value_duration = dict(zip(flow_values_vh, flow_duration_m))
-        self.create_demand_pattern()
+        self.rng = demand_rng(rng)  # Generator or seed
+        self._full_positions = None  # Drawn on first use, stream() does not need it
         self.sim_time = sim_time
 
-    def find_times_exponential(self, flow_vh: float = 60, time_min: int = 1) -> np.array:
+    def find_times_exponential(self, flow_vh: float = 60, time_min: int = 1, rng=None) -> np.array:
         """ Find the times of emission of x vehicles """
+        rng = rng if rng is not None else self.rng
         flow_vm = np.clip(flow_vh / 60, 1, C / 60)  # vehicles per minute (value given in veh/h)
         n_vehicles = int(flow_vm * time_min)
         arrival_rate = 3600 / flow_vh  # s / veh
-        self.time_headways = np.random.exponential(arrival_rate, n_vehicles)
+        self.time_headways = rng.exponential(arrival_rate, n_vehicles)
         return self.time_headways
 
-    def compute_headwayspace(self, flow_vh, time_min) -> np.array:
+    def compute_headwayspace(self, flow_vh, time_min, rng=None) -> np.array:
         """ Find headway space from a time gap"""
-        self.space_headways = self.find_times_exponential(flow_vh, time_min) * U_I
+        self.space_headways = self.find_times_exponential(flow_vh, time_min, rng) * U_I
         return self.space_headways
 
-    def compute_x0(self, flow_vh, time_min) -> np.array:
+    def compute_x0(self, flow_vh, time_min, rng=None) -> np.array:
         """ Find intial positions for vehicles"""
-        return np.cumsum(self.compute_headwayspace(flow_vh, time_min))
-
-    def create_demand_pattern(self):
-        full_positions = np.array([0])
-        for flow, duration in self.value_duration.items():
-            new_spacings = full_positions[-1] + self.compute_x0(flow, duration)
-            full_positions = np.concatenate((full_positions, new_spacings))
-        self.full_positions = full_positions
+        return np.cumsum(self.compute_headwayspace(flow_vh, time_min, rng))
+
+    @property
+    def pattern(self) -> tuple:
+        """ Hashable demand pattern (flows, durations)"""
+        return tuple(self.value_duration.keys()), tuple(self.value_duration.values())
+
+    def sample_positions(self, rng=None) -> np.array:
+        """ Draw initial positions for the whole pattern (self.rng by default)"""
+        rng = rng if rng is not None else self.rng
+        self.time_headways = draw_headways((self.pattern,), rng)[0]
+        self.space_headways = self.time_headways * U_I
+        return headways_to_positions(self.time_headways)
+
+    def create_demand_pattern(self, rng=None):
+        self._full_positions = self.sample_positions(rng)
+
+    @property
+    def full_positions(self) -> np.array:
+        """ Initial positions of the whole pattern, drawn from self.rng on first use"""
+        if self._full_positions is None:
+            self.create_demand_pattern()
+        return self._full_positions
+
+    def stream(self, mpr: float = 0, chunk: int = CHUNK_ARRIVALS, rng=None) -> "DemandStream":
+        """ Arrivals over time of the demand pattern (self.rng by default)"""
+        rng = rng if rng is not None else self.rng
+        return DemandStream(
+            tuple(self.value_duration.keys()), tuple(self.value_duration.values()), mpr, chunk, rng
+        )
 
     def plot_demand_elements(self) -> None:
         """ A plot to illustrate the demand behavior created 
         """
+        if self._full_positions is None:
+            self.create_demand_pattern()
         space_hwy = plot_histogram(self.space_headways, "Spacing [m]")
         time_hwy = plot_histogram(self.time_headways, "Time Gap [s]")
         time_sim = [0] + list(self.value_duration.values())
@@ -85,12 +162,119 @@ class Demand:
         return str(self.value_duration)
 
 
+class DemandStream:
+    """ Arrivals of a piecewise constant demand drawn chunk by chunk
+
+        Arrivals follow a Poisson process of rate flow_vh / 3600 within each
+        period, memory only holds the current chunk whatever the horizon.
+
+        stream = Demand(flows, durations).stream(mpr=0.5)
+        vid, times, types = stream.pull(t)  # Arrivals up to time t [s]
+    """
+
+    def __init__(
+        self,
+        flow_values_vh=(C,),
+        flow_duration_m=(1,),
+        mpr: float = 0,
+        chunk: int = CHUNK_ARRIVALS,
+        rng=None,
+    ):
+        self.flows = np.array(flow_values_vh, dtype=float)
+        self.ends = np.cumsum(flow_duration_m) * 60.0  # Period ends [s]
+        self.mpr = mpr
+        self.chunk = chunk
+        self.rng = demand_rng(rng)
+        self.period = 0
+        self.clock = 0.0  # Time of the last drawn arrival [s]
+        self.n_drawn = 0
+        self._times = np.empty(0)
+        self._types = np.empty(0, dtype="<U3")
+        self._k = 0
+
+    @property
+    def exhausted(self) -> bool:
+        """ True once every arrival has been handed out"""
+        return self.period == len(self.flows) and self._k == len(self._times)
+
+    def draw_chunk(self) -> None:
+        """ Draw the next chunk of arrivals"""
+        times = []
+        n = 0
+        while n < self.chunk and self.period < len(self.flows):
+            flow, end = self.flows[self.period], self.ends[self.period]
+            if flow <= 0:
+                self.period, self.clock = self.period + 1, end
+                continue
+            arrivals = self.clock + np.cumsum(self.rng.exponential(3600 / flow, self.chunk - n))
+            inside = arrivals[arrivals < end]
+            times.append(inside)
+            n += len(inside)
+            if len(inside) < len(arrivals):  # Memoryless: restart at the period end
+                self.period, self.clock = self.period + 1, end
+            else:
+                self.clock = inside[-1]
+        self._times = np.concatenate(times) if times else np.empty(0)
+        cav = self.rng.random(len(self._times)) < self.mpr
+        self._types = np.where(cav, "CAV", "HDV")
+        self._k = 0
+        self.n_drawn += len(self._times)
+
+    def pull(self, t: float) -> tuple:
+        """ Arrivals with time <= t: (vehicle ids, times, types)"""
+        vid, times, types = [], [], []
+        while True:
+            if self._k == len(self._times):
+                if self.period == len(self.flows):
+                    break
+                self.draw_chunk()
+                continue
+            k = self._k + np.searchsorted(self._times[self._k :], t, side="right")
+            first = self.n_drawn - len(self._times) + self._k
+            vid.append(np.arange(first, first + k - self._k))
+            times.append(self._times[self._k : k])
+            types.append(self._types[self._k : k])
+            self._k = k
+            if k < len(self._times):
+                break
+        if not vid:
+            return np.empty(0, dtype=int), np.empty(0), np.empty(0, dtype="<U3")
+        return np.concatenate(vid), np.concatenate(times), np.concatenate(types)
+
+    def __iter__(self):
+        """ Iterate over chunks (vehicle ids, times, types)"""
+        while True:
+            if self._k == len(self._times):
+                if self.period == len(self.flows):
+                    return
+                self.draw_chunk()
+                continue
+            yield self.pull(self._times[-1])
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({tuple(self.flows)},{tuple(np.diff(self.ends, prepend=0) / 60)})"
+
+
 class TrafficDemand(collections.abc.MutableMapping):
     """ Demand for a traffic network"""
 
     def __init__(self, lks: tuple = (0,), demands: tuple = Demand()):
         self.__dct = dict(zip(lks, demands))
 
+    def positions(self, seed=None, rng=None) -> dict:
+        """ Initial positions of every link drawn in a single pass {link: positions}
+
+            Without a generator the draw is the one of the "demand" stream of
+            spawn_streams(seed) (SEED when None) and is memoized by (patterns, seed).
+        """
+        links = tuple(lk for lk, dmd in self.__dct.items() if dmd)
+        patterns = tuple(self.__dct[lk].pattern for lk in links)
+        if rng is None:
+            positions = cached_positions(patterns, SEED if seed is None else seed)
+        else:
+            positions = tuple(headways_to_positions(h) for h in draw_headways(patterns, rng))
+        return dict(zip(links, positions))
+
     def __getitem__(self, item):
         return self.__dct.get(item, None)
 
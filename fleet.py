@@ -0,0 +1,894 @@
+"""
+    Fleet state engine
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import heapq
+from collections import deque
+
+import numpy as np
+
+from vehicles import DT, U_I
+from carfollow import A_MAX, A_MIN, B, C_1, C_2, C_3, DELTA, S_0
+from kernels import DEFAULT_BACKEND, GAMMA, LAWS, select_backend
+from noise import NoiseSource, NoiseStack
+from recorder import RecordingPolicy, TrajectoryRecorder
+from support import ProfileBank, TabulatedProfile
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+NO_LEADER = -1  # Leader index of a platoon head
+NO_CONTROL = -1  # Profile index of a vehicle without registered control
+DEFAULT_LAW = "Tampere"
+CHECKPOINT_ARRAYS = ("x_t", "v_t", "a_t", "a", "idx", "lead", "acc", "profile", "alive", "active")
+
+# Active set stepping
+ACTIVE_REFRESH = 10  # Steps between sleep decisions
+V_TAIL = 1e-6  # Largest gap to U_I of a profile tail treated as free flow [m/s]
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class FleetState:
+    """
+        Struct-of-arrays state of a platoon.
+
+        Vehicle i follows vehicle lead[i], heads have lead[i] = -1. Leaders
+        are expected to be stored before their followers, as in veh_list.
+        Each vehicle follows a car following law registered in kernels.LAWS,
+        vehicles are advanced by one kernel call per law.
+
+        To initialize a fleet
+
+        FleetState(x0, v0)
+        FleetState(x0, v0, law=["IDM", "Tampere", ...])
+
+    """
+
+    def __init__(
+        self,
+        x0: np.ndarray,
+        v0: np.ndarray,
+        veh_type: tuple = None,
+        leader: np.ndarray = None,
+        c1: float = C_1,
+        c2: float = C_2,
+        c3: float = C_3,
+        backend: str = DEFAULT_BACKEND,
+        noise: NoiseSource = None,
+        law=DEFAULT_LAW,
+        a_max: float = A_MAX,
+        b: float = B,
+        delta: float = DELTA,
+    ) -> None:
+        """
+            Initialization of fleet state
+        """
+        self.x_t = np.array(x0, dtype=float)
+        n = len(self.x_t)
+        self.v_t = np.array(np.broadcast_to(v0, n), dtype=float)
+        self.a_t = np.zeros(n)
+        self.a = np.zeros(n)
+
+        # Vehicle info
+        self.idx = np.arange(n)
+        self.type = np.array(veh_type if veh_type is not None else ("HDV",) * n)
+
+        # Platoon structure: default is a single lane platoon
+        if leader is None:
+            leader = np.arange(-1, n - 1)
+        self.lead = np.array(leader, dtype=int)
+
+        # Tampere parameters
+        self.c1 = np.array(np.broadcast_to(c1, n), dtype=float)
+        self.c2 = np.array(np.broadcast_to(c2, n), dtype=float)
+        self.c3 = np.array(np.broadcast_to(c3, n), dtype=float)
+
+        # IDM parameters
+        self.a_max = np.array(np.broadcast_to(a_max, n), dtype=float)
+        self.b = np.array(np.broadcast_to(b, n), dtype=float)
+        self.delta = np.array(np.broadcast_to(delta, n), dtype=float)
+
+        # Car following law: vehicle i follows laws[law[i]]
+        self.laws, self.law = np.unique(np.broadcast_to(law, n), return_inverse=True)
+        self.laws = tuple(str(name) for name in self.laws)
+        for name in self.laws:
+            if name not in LAWS:
+                raise ValueError(f"Unknown car following law {name}, choose among {tuple(LAWS)}")
+
+        # Registered controls (desired speed profiles)
+        self.acc = np.zeros(n, dtype=bool)
+        self.profile = np.full(n, NO_CONTROL)
+        self._controls = []
+        self._control_ids = {}
+        self._groups = None
+        self.bank = ProfileBank()  # Tabulated controls
+
+        self.control = 0.0
+        self.kernels = select_backend(backend)
+        self.noise = noise  # NoiseSource for the followers, global stream by default
+
+        # Ensemble members: vehicles offsets[e]:offsets[e+1] belong to member e
+        self.offsets = np.array([0, n])
+
+        # Active set (None: every vehicle is stepped with the full law)
+        self.active = None
+
+        # Occupied slots (None: every vehicle is on the road), see SlotPool
+        self.alive = None
+
+    @classmethod
+    def from_vehicles(cls, veh_list: list, backend: str = DEFAULT_BACKEND) -> "FleetState":
+        """
+            Build a fleet from a list of vehicles (leaders first)
+        """
+        position = {id(veh): i for i, veh in enumerate(veh_list)}
+        fleet = cls(
+            x0=[veh.x_t for veh in veh_list],
+            v0=[veh.v_t for veh in veh_list],
+            veh_type=tuple(veh.type for veh in veh_list),
+            leader=[position.get(id(veh.veh_lead), NO_LEADER) for veh in veh_list],
+            c1=[getattr(veh, "c1", C_1) for veh in veh_list],
+            c2=[getattr(veh, "c2", C_2) for veh in veh_list],
+            c3=[getattr(veh, "c3", C_3) for veh in veh_list],
+            backend=backend,
+            law=[veh.behavior or DEFAULT_LAW for veh in veh_list],
+            a_max=[getattr(veh, "a_max", A_MAX) for veh in veh_list],
+            b=[getattr(veh, "b", B) for veh in veh_list],
+            delta=[getattr(veh, "delta", DELTA) for veh in veh_list],
+        )
+        fleet.idx = np.array([veh.idx for veh in veh_list])
+        fleet.a_t = np.array([veh.a_t for veh in veh_list], dtype=float)
+        fleet.a = np.array([veh.a for veh in veh_list], dtype=float)
+        for i, veh in enumerate(veh_list):
+            if getattr(veh, "acc", False):
+                fleet.register_control_speed(i, veh._vd)
+        return fleet
+
+    @classmethod
+    def stack(cls, fleets: list) -> "FleetState":
+        """
+            Ensemble of independent fleets (replications, parameter sets)
+            advanced together. Heads share the control of the ensemble.
+        """
+        offsets = np.concatenate(([0], np.cumsum([len(f) for f in fleets])))
+        lead = [
+            np.where(f.lead == NO_LEADER, NO_LEADER, f.lead + off)
+            for f, off in zip(fleets, offsets)
+        ]
+        fleet = cls(
+            x0=np.concatenate([f.x_t for f in fleets]),
+            v0=np.concatenate([f.v_t for f in fleets]),
+            veh_type=np.concatenate([f.type for f in fleets]),
+            leader=np.concatenate(lead),
+            c1=np.concatenate([f.c1 for f in fleets]),
+            c2=np.concatenate([f.c2 for f in fleets]),
+            c3=np.concatenate([f.c3 for f in fleets]),
+            backend=fleets[0].kernels.name,
+            law=np.concatenate([np.array(f.laws)[f.law] for f in fleets]),
+            a_max=np.concatenate([f.a_max for f in fleets]),
+            b=np.concatenate([f.b for f in fleets]),
+            delta=np.concatenate([f.delta for f in fleets]),
+        )
+        fleet.idx = np.concatenate([f.idx for f in fleets])
+        fleet.a_t = np.concatenate([f.a_t for f in fleets])
+        fleet.a = np.concatenate([f.a for f in fleets])
+        fleet.control = fleets[0].control
+        fleet.offsets = offsets
+        if all(f.noise is not None for f in fleets):
+            fleet.noise = NoiseStack([f.noise for f in fleets])
+        for f, off in zip(fleets, offsets):
+            for pid, control in enumerate(f._controls):
+                idx = np.flatnonzero(f.profile == pid)
+                if len(idx):
+                    fleet.register_control_speed(idx + off, control)
+        return fleet
+
+    @property
+    def n_members(self) -> int:
+        """
+            Number of ensemble members
+        """
+        return len(self.offsets) - 1
+
+    @property
+    def shape(self) -> tuple:
+        """
+            Ensemble shape (E, N), N is None if members differ in size
+        """
+        sizes = np.diff(self.offsets)
+        return (self.n_members, int(sizes[0]) if np.all(sizes == sizes[0]) else None)
+
+    def ensemble_view(self, values: np.ndarray) -> np.ndarray:
+        """
+            View of per-vehicle values (..., E*N) as (..., E, N)
+        """
+        return values.reshape(values.shape[:-1] + self.shape)
+
+    def split(self, values: np.ndarray, columns: np.ndarray = None) -> list:
+        """
+            Split per-vehicle values (..., N) into a list of member views.
+            columns: vehicles present in values when only a subset is given.
+        """
+        bounds = self.offsets[1:-1]
+        if columns is not None:
+            bounds = np.searchsorted(columns, bounds)
+        return np.split(values, bounds, axis=-1)
+
+    def update_vehicles(self, veh_list: list) -> None:
+        """
+            Write the fleet state back into the vehicle objects
+        """
+        self.synchronize()
+        for i, veh in enumerate(veh_list):
+            veh.x_t = self.x_t[i]
+            veh.v_t = self.v_t[i]
+            veh.a_t = self.a_t[i]
+            veh.a = self.a[i]
+            veh.control = self.control
+
+    def __len__(self) -> int:
+        """ Number of vehicles"""
+        return len(self.x_t)
+
+    @property
+    def followers(self) -> np.ndarray:
+        """
+            Indices of vehicles with a leader
+        """
+        if self.alive is not None:
+            return np.flatnonzero((self.lead != NO_LEADER) & self.alive)
+        return np.flatnonzero(self.lead != NO_LEADER)
+
+    @property
+    def heads(self) -> np.ndarray:
+        """
+            Indices of vehicles without leader
+        """
+        if self.alive is not None:
+            return np.flatnonzero((self.lead == NO_LEADER) & self.alive)
+        return np.flatnonzero(self.lead == NO_LEADER)
+
+    def register_control_speed(self, idx, control) -> None:
+        """
+            Register an external control signal for vehicle(s) idx
+        """
+        pid = self._control_ids.get(id(control))
+        if pid is None:
+            pid = len(self._controls)
+            self._controls.append(control)
+            self._control_ids[id(control)] = pid
+        self.profile[idx] = pid
+        self.acc[idx] = True
+        self._groups = None
+        if self.active is not None:
+            self.wake(idx)  # Messages wake vehicles up
+
+    @property
+    def groups(self) -> list:
+        """
+            Registered controls that are not tabulated: [(pid, control), ...]
+
+            Tabulated controls are evaluated at once through the profile bank,
+            veh_bank holds the bank index of each vehicle (-1 if none).
+        """
+        if self._groups is None:
+            bank_ids = np.array(
+                [
+                    self.bank.index(ctrl) if isinstance(ctrl, TabulatedProfile) else NO_CONTROL
+                    for ctrl in self._controls
+                ]
+                + [NO_CONTROL]  # Vehicles without control (profile -1)
+            )
+            self.veh_bank = bank_ids[self.profile]
+            self._groups = [
+                (pid, control)
+                for pid, control in enumerate(self._controls)
+                if bank_ids[pid] == NO_CONTROL
+            ]
+        return self._groups
+
+    def desired_speed(self, idx: np.ndarray) -> np.ndarray:
+        """
+            Desired speed of vehicles idx
+        """
+        groups = self.groups
+        x_t = self.x_t[idx]
+        vd = np.full(len(idx), float(U_I))
+        bank_ids = self.veh_bank[idx]
+        tab = bank_ids != NO_CONTROL
+        if tab.any():
+            vd[tab] = self.bank.evaluate(bank_ids[tab], x_t[tab])
+        if groups:
+            profile = self.profile[idx]
+            for pid, control in groups:
+                sel = profile == pid
+                if sel.any():
+                    vd[sel] = control(x_t[sel])
+        hd = self.lead[idx] == NO_LEADER
+        if hd.any():
+            vd[hd] = self.control(x_t[hd]) if callable(self.control) else U_I
+        return vd
+
+    @property
+    def vd(self) -> np.ndarray:
+        """
+            Vehicles desired speed
+        """
+        self.synchronize()
+        return self.desired_speed(np.arange(len(self)))
+
+    @property
+    def v(self) -> np.ndarray:
+        """
+            Dynamic equation speed
+        """
+        self.synchronize()
+        return np.maximum(self.v_t + self.a * DT, 0)
+
+    @property
+    def x(self) -> np.ndarray:
+        """
+            Dynamic equation position
+        """
+        return self.x_t + self.v * DT
+
+    def shift_state(self) -> None:
+        """
+            Shift state
+        """
+        if self.active is None:
+            self.kernels.shift(self.x_t, self.v_t, self.a_t, self.a)
+            return
+        i = self._awake  # Sleeping vehicles are advanced in closed form when read
+        v = np.maximum(self.v_t[i] + self.a[i] * DT, 0)
+        self.x_t[i] += v * DT
+        self.v_t[i] = v
+        self.a_t[i] = self.a[i]
+        self._step += 1
+
+    def enable_active_set(self, refresh: int = ACTIVE_REFRESH) -> None:
+        """
+            Step only interacting vehicles, see update_active_set.
+
+            A sleeping vehicle follows the free-flow law a = c3 (U_I - v),
+            which has a closed form, so it is only advanced when its state is
+            read (leader of an awake vehicle, wake up, synchronize). A step
+            costs O(awake vehicles) plus the O(N) noise draw (skipped when
+            sigma is 0). Vehicles sleep before and after the tabulated span
+            of their profile (a tail within V_TAIL of U_I counts as free
+            flow), so noise-free runs stay within 2e-5 m of full stepping
+            over 960 steps with messages and 1e-11 m without (benchmark.py).
+            The noise of a sleeping vehicle cannot be dropped without
+            changing the run, so noisy fleets (sigma > 0) are refused. Only
+            Tampere followers sleep, slot pools are not supported.
+
+            The bookkeeping only pays off from about 1000 vehicles, below
+            that (the usual platoons of 10 to 100 vehicles) a step is about
+            2x slower than full stepping.
+        """
+        if self.alive is not None:
+            raise ValueError("Active set stepping is not available on slot pools")
+        if self.noise_source().sigma:
+            raise ValueError("Active set stepping needs a noise-free fleet (NoiseSource sigma=0)")
+        n = len(self)
+        self.active = np.ones(n, dtype=bool)
+        self.refresh = refresh
+        self._step = 0
+        self._synced = 0
+        self._sleep = np.zeros((3, n))  # Step, position and speed gap U_I - v when put to sleep
+        self._wakeups = []  # Heap of (step, vehicle, sleep step) before profile transitions
+        self.index_platoon()
+
+    def disable_active_set(self) -> None:
+        """
+            Back to full stepping
+        """
+        if self.active is not None:
+            self.synchronize()
+        self.active = None
+
+    def index_platoon(self) -> None:
+        """
+            Indices used by the active set: awake vehicles, heads, noise
+            column of each follower and followers sorted by leader
+        """
+        fl = self.followers
+        self._awake = np.flatnonzero(self.active)
+        self._frontier = None
+        self._heads = self.heads
+        self._noise_col = np.full(len(self), -1)
+        self._noise_col[fl] = np.arange(len(fl))
+        self._by_leader = fl[np.argsort(self.lead[fl], kind="stable")]
+        self._leader_sorted = self.lead[self._by_leader]
+
+    def children(self, idx: np.ndarray) -> np.ndarray:
+        """
+            Followers of vehicles idx
+        """
+        left = np.searchsorted(self._leader_sorted, idx, side="left")
+        counts = np.searchsorted(self._leader_sorted, idx, side="right") - left
+        first = np.repeat(left - np.cumsum(counts) + counts, counts)
+        return self._by_leader[first + np.arange(counts.sum())]
+
+    @property
+    def frontier(self) -> tuple:
+        """
+            Awake followers and followers of awake vehicles, kept until the
+            active set changes
+        """
+        if self._frontier is None:
+            awake = self._awake
+            self._frontier = (awake[self.lead[awake] != NO_LEADER], self.children(awake))
+        return self._frontier
+
+    def advance_sleeping(self, idx: np.ndarray) -> None:
+        """
+            State of sleeping vehicles idx at the current step (closed form of
+            the free-flow law from the step they were put to sleep)
+        """
+        if not len(idx):
+            return
+        t0, x0, e0 = self._sleep[:, idx]
+        c3 = self.c3[idx]
+        r = 1 - c3 * DT
+        j = self._step - t0
+        r_j = r ** j
+        self.v_t[idx] = U_I - e0 * r_j
+        self.x_t[idx] = x0 + DT * (j * U_I - e0 * r * (1 - r_j) / (1 - r))
+        self.a[idx] = c3 * e0 * r_j
+        self.a_t[idx] = np.where(j > 0, self.a[idx] / r, self.a_t[idx])
+
+    def synchronize(self) -> None:
+        """
+            Bring every sleeping vehicle to the current step, before reading
+            the whole state
+        """
+        if self.active is None or self._synced == self._step:
+            return
+        self.advance_sleeping(np.flatnonzero(~self.active))
+        self._synced = self._step
+
+    def wake(self, idx) -> None:
+        """
+            Step vehicles idx with their law again
+        """
+        idx = np.atleast_1d(idx)
+        if not len(idx) or self.active[idx].all():
+            return
+        idx = np.unique(idx[~self.active[idx]])
+        self.advance_sleeping(idx)
+        self.active[idx] = True
+        self._awake = np.union1d(self._awake, idx)
+        self._frontier = None
+
+    def sleep(self, idx: np.ndarray, wake_step: np.ndarray) -> None:
+        """
+            Advance vehicles idx in closed form until they are woken up, at
+            wake_step at the latest (inf: no profile transition ahead)
+        """
+        e = U_I - self.v_t[idx]
+        self._sleep[0, idx] = self._step
+        self._sleep[1, idx] = self.x_t[idx]
+        self._sleep[2, idx] = e
+        self.a[idx] = self.c3[idx] * e  # Free-flow branch of the law
+        self.active[idx] = False
+        self._awake = np.setdiff1d(self._awake, idx, assume_unique=True)
+        self._frontier = None
+        for step, i in zip(wake_step.tolist(), idx.tolist()):
+            if step < np.inf:
+                heapq.heappush(self._wakeups, (int(step), i, self._step))
+
+    def congested(self, idx: np.ndarray) -> np.ndarray:
+        """
+            Tampere followers idx whose congested branch is below the free-flow
+            branch (the law would not be free flow at this step)
+        """
+        ld = self.lead[idx]
+        v = self.v_t[idx]
+        s = self.x_t[ld] - self.x_t[idx]
+        cong_acc = self.c1[idx] * (self.v_t[ld] - v) + self.c2[idx] * (s - S_0 - GAMMA * v)
+        return cong_acc < self.c3[idx] * (U_I - v)
+
+    def free_flow_margin(self, idx: np.ndarray) -> np.ndarray:
+        """
+            Lower bound of congested minus free-flow acceleration of followers
+            idx as long as they and their leaders relax freely towards U_I.
+            The speed gaps e = U_I - v decay as (1 - c3 DT)^k, so the spacing
+            drifts by at most DT (|e_f| r_f / (1 - r_f) + |e_l| r_l / (1 - r_l)).
+        """
+        ld = self.lead[idx]
+        c1, c2, c3 = self.c1[idx], self.c2[idx], self.c3[idx]
+        e_f, e_l = np.abs(U_I - self.v_t[idx]), np.abs(U_I - self.v_t[ld])
+        r_f, r_l = 1 - c3 * DT, 1 - self.c3[ld] * DT
+        drift = DT * (e_f * r_f / (1 - r_f) + e_l * r_l / (1 - r_l))
+        s = self.x_t[ld] - self.x_t[idx]
+        return (
+            c2 * (s - S_0 - GAMMA * U_I - drift) - (c1 + c2 * GAMMA + c3) * e_f - c1 * e_l
+        )
+
+    def quiet_until(self, idx: np.ndarray) -> np.ndarray:
+        """
+            Step until which the desired speed of vehicles idx stays U_I
+            (inf: for good, current step: not quiet). Tabulated profiles are
+            constant outside their grid, callable controls are never quiet.
+        """
+        until = np.full(len(idx), float(self._step))
+        self.groups  # Bank index of each vehicle
+        bank_ids = self.veh_bank[idx]
+        until[self.profile[idx] == NO_CONTROL] = np.inf
+        tab = np.flatnonzero(bank_ids != NO_CONTROL)
+        if len(tab):
+            x = self.x_t[idx[tab]]
+            x_min, x_max, v_min, v_max = self.bank.limits(bank_ids[tab])
+            passed = (x > x_max) & (np.abs(v_max - U_I) <= V_TAIL)
+            ahead = (x < x_min) & (np.abs(v_min - U_I) <= V_TAIL)
+            v_up = np.maximum(self.v_t[idx[tab]], U_I)  # Speeds relax towards U_I
+            steps = np.floor((x_min - x) / (v_up * DT))
+            until[tab] = np.where(passed, np.inf, np.where(ahead, self._step + steps, self._step))
+        return until
+
+    def update_active_set(self) -> None:
+        """
+            Wake up and put to sleep vehicles, in O(awake vehicles).
+
+            Every step: vehicles reaching the grid of their tabulated profile
+            wake up (scheduled when put to sleep), leaders of awake followers
+            are advanced, and sleeping followers of awake vehicles wake up as
+            soon as their law leaves the free-flow branch (exact test).
+            Every refresh steps: awake Tampere followers with a desired speed
+            of U_I ahead and a positive free_flow_margin go to sleep. Sleeping
+            followers of new sleepers are checked against the same margin.
+        """
+        due = []
+        while self._wakeups and self._wakeups[0][0] <= self._step:
+            _, i, t0 = heapq.heappop(self._wakeups)
+            if not self.active[i] and self._sleep[0, i] == t0:
+                due.append(i)
+        if due:
+            self.wake(np.array(due))
+
+        fl, boundary = self.frontier
+        ld = self.lead[fl]
+        self.advance_sleeping(ld[~self.active[ld]])
+        boundary = boundary[~self.active[boundary]]
+        if len(boundary):
+            self.advance_sleeping(boundary)
+            self.wake(boundary[self.congested(boundary)])
+
+        if (self._step - 1) % self.refresh:  # Steps 1, 1 + refresh, ...
+            return
+        idx = fl[self.law[fl] == self.laws.index("Tampere")] if "Tampere" in self.laws else fl[:0]
+        if not len(idx):
+            return
+        e = U_I - self.v_t[idx]
+        c3 = self.c3[idx]
+        closed_form = (c3 * DT > 0) & (c3 * DT < 1) & (e < U_I) & (A_MIN <= c3 * e) & (c3 * e <= A_MAX)
+        until = self.quiet_until(idx)
+        asleep = closed_form & (until > self._step) & (self.free_flow_margin(idx) > 0)
+        if not asleep.any():
+            return
+        self.sleep(idx[asleep], until[asleep])
+        kids = self.children(idx[asleep])
+        kids = kids[~self.active[kids]]
+        if len(kids):
+            self.advance_sleeping(kids)
+            self.wake(kids[self.free_flow_margin(kids) <= 0])
+
+    def follows(self, name: str) -> np.ndarray:
+        """
+            Vehicles following law name (mask)
+        """
+        if name not in self.laws:
+            return np.zeros(len(self), dtype=bool)
+        return self.law == self.laws.index(name)
+
+    def law_parameters(self, name: str) -> tuple:
+        """
+            Parameter arrays of law name
+        """
+        return tuple(getattr(self, param) for param in LAWS[name][2])
+
+    def noise_source(self) -> NoiseSource:
+        """
+            Noise source of the fleet, created on the global stream if unset
+        """
+        if self.noise is None:
+            n = len(self.followers) if self.alive is None else len(self)
+            self.noise = NoiseSource(n)
+        return self.noise
+
+    def car_following(self) -> None:
+        """
+            Acceleration car following for the whole fleet
+
+            Note:
+                if leader
+                    min(cong_acc, free_acc) -> Tampere
+                    a (1 - (v/vd)^d - (sd/s)^2) -> IDM
+                else
+                    manual acceleration
+        """
+        noise = self.noise_source().draw()
+        if self.active is not None:
+            self.update_active_set()
+            fl = self.frontier[0]
+            hd = self._heads
+            noise = noise[self._noise_col[fl]]
+            vd = np.empty(len(self))
+            vd[fl] = self.desired_speed(fl)
+            vd[hd] = self.desired_speed(hd)
+        else:
+            fl, hd = self.followers, self.heads
+            if self.alive is None:
+                vd = self.vd
+            else:
+                noise = noise[fl]  # One noise column per slot
+                vd = np.empty(len(self))
+                vd[fl] = self.desired_speed(fl)
+                vd[hd] = self.desired_speed(hd)
+        if len(self.laws) == 1:
+            name = self.laws[0]
+            self.kernels.law(name)(
+                self.x_t, self.v_t, self.lead, fl, hd, *self.law_parameters(name), vd, noise, self.a
+            )
+            return
+        law_fl, law_hd = self.law[fl], self.law[hd]
+        for k, name in enumerate(self.laws):
+            sel = law_fl == k
+            self.kernels.law(name)(
+                self.x_t,
+                self.v_t,
+                self.lead,
+                fl[sel],
+                hd[law_hd == k],
+                *self.law_parameters(name),
+                vd,
+                noise[sel],
+                self.a,
+            )
+
+    def step_evolution(self, control=0) -> None:
+        """
+            Use this method to a single step in the simulation
+        """
+        self.shift_state()  # x_{k-1} = x{k} move info from last time step into current
+        self.control = control  # Update control
+        self.car_following()  # Update acceleration
+
+    def checkpoint(self) -> dict:
+        """
+            Copy of the full state: vehicles, controls, active set and noise
+            (including the generator state)
+        """
+        state = {
+            name: None if getattr(self, name) is None else getattr(self, name).copy()
+            for name in CHECKPOINT_ARRAYS
+        }
+        state["control"] = self.control
+        state["controls"] = list(self._controls)
+        state["step"] = getattr(self, "_step", 0)
+        state["sleep"] = None
+        if self.active is not None:
+            state["sleep"] = (self._sleep.copy(), list(self._wakeups), self.refresh, self._synced)
+        state["noise"] = self.noise_source().checkpoint()  # Before the first draw too
+        return state
+
+    def restore(self, state: dict) -> None:
+        """
+            Continue from a checkpoint, a checkpoint can be restored many times
+        """
+        for name in CHECKPOINT_ARRAYS:
+            value = state[name]
+            setattr(self, name, None if value is None else value.copy())
+        self.control = state["control"]
+        self._controls = list(state["controls"])
+        self._control_ids = {id(control): pid for pid, control in enumerate(self._controls)}
+        self._groups = None
+        self._step = state["step"]
+        if state["sleep"] is not None:
+            sleep, wakeups, self.refresh, self._synced = state["sleep"]
+            self._sleep, self._wakeups = sleep.copy(), list(wakeups)
+            self.index_platoon()
+        if state["noise"] is not None:
+            self.noise.restore(state["noise"])
+
+
+class SlotPool:
+    """
+        Fixed capacity pool of vehicle slots of a lane.
+
+        Vehicles are injected at the upstream boundary and retired once they
+        pass the lane length, their slot is then reused. Only occupied slots
+        are stepped, so the cost depends on the vehicles on the road and not
+        on the total demand. The noise source has one column per slot.
+
+        To initialize a pool
+
+        SlotPool(capacity, length)
+
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        length: float,
+        backend: str = DEFAULT_BACKEND,
+        noise: NoiseSource = None,
+    ) -> None:
+        self.fleet = FleetState(
+            np.zeros(capacity), 0.0, leader=np.full(capacity, NO_LEADER), backend=backend, noise=noise
+        )
+        self.fleet.alive = np.zeros(capacity, dtype=bool)
+        self.fleet.idx = np.full(capacity, -1)  # Vehicle id of each slot
+        self.length = length
+        self.free = list(range(capacity - 1, -1, -1))  # Free slots, lowest last
+        self.tail = NO_LEADER  # Slot of the last injected vehicle
+
+    def __len__(self) -> int:
+        """ Number of vehicles on the lane"""
+        return int(self.fleet.alive.sum())
+
+    @property
+    def capacity(self) -> int:
+        """
+            Number of slots
+        """
+        return len(self.fleet)
+
+    @property
+    def slots(self) -> np.ndarray:
+        """
+            Occupied slots
+        """
+        return np.flatnonzero(self.fleet.alive)
+
+    def inject(self, vid: int, x0: float = 0.0, v0: float = U_I, veh_type: str = "HDV") -> int:
+        """
+            Vehicle vid enters behind the last vehicle, returns its slot
+        """
+        if not self.free:
+            raise OverflowError(f"Lane pool full ({self.capacity} slots), increase capacity")
+        slot = self.free.pop()
+        fleet = self.fleet
+        fleet.x_t[slot], fleet.v_t[slot] = x0, v0
+        fleet.a_t[slot] = fleet.a[slot] = 0.0
+        fleet.idx[slot], fleet.type[slot] = vid, veh_type
+        fleet.lead[slot] = self.tail
+        fleet.profile[slot], fleet.acc[slot] = NO_CONTROL, False
+        fleet.alive[slot] = True
+        fleet._groups = None
+        self.tail = slot
+        return slot
+
+    def retire(self) -> np.ndarray:
+        """
+            Vehicles past the lane length leave, returns their ids
+        """
+        fleet = self.fleet
+        gone = np.flatnonzero(fleet.alive & (fleet.x_t > self.length))
+        if not len(gone):
+            return gone
+        vid = fleet.idx[gone]
+        fleet.alive[gone] = False
+        fleet.lead[np.isin(fleet.lead, gone)] = NO_LEADER  # New heads take the control
+        fleet.lead[gone] = NO_LEADER
+        fleet.profile[gone], fleet.acc[gone] = NO_CONTROL, False
+        fleet.idx[gone] = -1
+        fleet._groups = None
+        if self.tail in gone:
+            self.tail = NO_LEADER
+        self.free.extend(gone[::-1].tolist())
+        return vid
+
+    def step_evolution(self, control=0) -> np.ndarray:
+        """
+            One step of the vehicles on the lane, returns the ids that left
+        """
+        self.fleet.step_evolution(control)
+        return self.retire()
+
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def simulate(
+    fleet: FleetState,
+    n_steps: int,
+    control=0,
+    policy: RecordingPolicy = None,
+    scheduler=None,
+    observers: tuple = (),
+) -> TrajectoryRecorder:
+    """
+        Run n_steps of a fleet and record them following a recording policy.
+        Messages of the scheduler are delivered before each step, observers
+        (e.g. phem.PhemExporter) receive the fleet after each step.
+    """
+    recorder = TrajectoryRecorder.from_fleet(fleet, n_steps, policy)
+    for t in range(n_steps):
+        if scheduler is not None:
+            scheduler.fire(fleet, t)
+        fleet.step_evolution(control=control)
+        recorder.record_fleet(fleet)
+        for observer in observers:
+            observer.record_fleet(fleet)
+    return recorder
+
+
+def simulate_ensemble(
+    fleets: list, n_steps: int, control=0, policy: RecordingPolicy = None, scheduler=None
+) -> list:
+    """
+        Run several fleets in a single batched pass. Scheduler events refer to
+        vehicles of the stacked fleet (member offset + vehicle index).
+
+        Returns a list with the recorded channels of each fleet {channel: (T, N)}
+    """
+    fleet = FleetState.stack(fleets)
+    recorder = simulate(fleet, n_steps, control, policy, scheduler)
+    channels = {
+        ch: fleet.split(recorder.channel(ch), recorder.columns) for ch in recorder.policy.channels
+    }
+    return [{ch: values[e] for ch, values in channels.items()} for e in range(fleet.n_members)]
+
+
+def simulate_inflow(pool: SlotPool, arrivals, n_steps: int, control=0, v0: float = U_I) -> tuple:
+    """
+        Run a lane pool fed by arriving vehicles. arrivals is either an array
+        of entry times [s] or a stream pulled every step (demand.DemandStream).
+        A vehicle enters at min(v0, v_tail, (x_tail - S_0) / GAMMA), the speed
+        whose desired spacing S_0 + GAMMA * v fits behind the last vehicle,
+        and waits at the boundary while that speed is not positive.
+
+        Returns vehicle ids, entry and exit steps (nan if still on the lane)
+    """
+    if not hasattr(arrivals, "pull"):
+        times = np.asarray(arrivals, dtype=float)
+        order = np.argsort(times, kind="stable")
+        arrivals = _ArrayArrivals(order, times[order])
+    waiting = deque()
+    vid, t_in, t_out = [], [], {}
+    for t in range(n_steps):
+        ids, _, types = arrivals.pull(t * DT)
+        waiting.extend(zip(ids.tolist(), types.tolist()))
+        while waiting:
+            tail = pool.tail
+            if tail == NO_LEADER:
+                v = v0
+            else:
+                x_tail, v_tail = pool.fleet.x_t[tail], pool.fleet.v_t[tail]
+                v = min(v0, v_tail, (x_tail - S_0) / GAMMA)
+                if v <= 0:
+                    break
+            i, veh_type = waiting.popleft()
+            pool.inject(i, 0.0, v, veh_type)
+            vid.append(i)
+            t_in.append(t)
+        for i in pool.step_evolution(control).tolist():
+            t_out[i] = t
+    return np.array(vid, dtype=int), np.array(t_in), np.array([t_out.get(i, np.nan) for i in vid])
+
+
+class _ArrayArrivals:
+    """
+        Pull interface over sorted entry times
+    """
+
+    def __init__(self, vid: np.ndarray, times: np.ndarray) -> None:
+        self.vid, self.times, self._k = vid, times, 0
+
+    def pull(self, t: float) -> tuple:
+        k = np.searchsorted(self.times, t, side="right")
+        sel = slice(self._k, k)
+        self._k = k
+        return self.vid[sel], self.times[sel], np.full(k - sel.start, "HDV")
@@ -0,0 +1,84 @@
+"""
+    Traffic indicators
+
+    Indicators are computed on the (T, N) trajectory arrays of a run (rows
+    are time steps, columns vehicles), without building DataFrames.
+    Positions are monotone in time, so the crossing of a section by every
+    vehicle is found with a binary search batched over vehicles (log2(T)
+    steps reading N positions each) and interpolated inside the step.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+from vehicles import DT
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def crossing_times(X: np.ndarray, positions, dt: float = DT) -> np.ndarray:
+    """
+        Time [s] at which each vehicle reaches positions (shape P + (N,)),
+        linearly interpolated between steps. Row 0 is time 0, vehicles
+        already past a position at time 0 get 0 and those never reaching it
+        NaN.
+    """
+    X = np.asarray(X, dtype=float)
+    T, N = X.shape
+    positions = np.asarray(positions, dtype=float)[..., None]
+    col = np.broadcast_to(np.arange(N), positions.shape[:-1] + (N,))
+
+    # Binary search of the first step with x >= position, all vehicles at once
+    k, hi = np.zeros(col.shape, dtype=int), np.full(col.shape, T)
+    for _ in range(int(np.ceil(np.log2(T + 1)))):
+        mid = (k + hi) // 2
+        below = X[np.minimum(mid, T - 1), col] < positions
+        searching = k < hi
+        k = np.where(searching & below, mid + 1, k)
+        hi = np.where(searching & ~below, mid, hi)
+
+    after = X[np.minimum(k, T - 1), col]
+    before = X[np.maximum(k - 1, 0), col]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = np.where(after > before, (positions - before) / (after - before), 1)
+    t = (k - 1 + np.clip(frac, 0, 1)) * dt
+    t[k == 0] = 0
+    t[k == T] = np.nan
+    return t
+
+
+def travel_times(X: np.ndarray, entry, exit_, dt: float = DT) -> np.ndarray:
+    """
+        Travel time [s] of each vehicle between entry and exit positions
+        (scalars or arrays of sections), NaN when a vehicle does not
+        complete the section
+    """
+    return crossing_times(X, exit_, dt) - crossing_times(X, entry, dt)
+
+
+def travel_time_statistics(X: np.ndarray, entry, exit_, dt: float = DT) -> dict:
+    """
+        Mean, standard deviation and total travel time [s] over the vehicles
+        completing the section (per section when given arrays)
+    """
+    tt = travel_times(X, entry, exit_, dt)
+    return dict(
+        meanTT=np.nanmean(tt, axis=-1), stdTT=np.nanstd(tt, axis=-1), totalTT=np.nansum(tt, axis=-1)
+    )
+
+
+def time_to_collision(X: np.ndarray, V: np.ndarray) -> float:
+    """
+        Mean over time of the mean positive time to collision [s]
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ttc = -np.diff(X, axis=1) / np.diff(V, axis=1)
+    ttc[~np.isfinite(ttc) | (ttc <= 0)] = np.nan
+    counts = np.sum(~np.isnan(ttc), axis=1)
+    per_step = np.nansum(ttc, axis=1)[counts > 0] / counts[counts > 0]
+    return per_step.mean() if len(per_step) else np.nan
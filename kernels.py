@@ -0,0 +1,233 @@
+"""
+    Car following kernels
+
+    Backends:
+        numpy: vectorized array operations (always available)
+        numba: compiled loops, used when numba is installed
+
+    Both backends take the same arguments, noise is drawn by the caller so
+    that they produce identical results for the same random stream.
+
+    Car following laws are registered in LAWS with their parameter names,
+    a law kernel has the signature
+
+        law(x_t, v_t, lead, fl, hd, *params, vd, noise, a)
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+from vehicles import DT, K_X, W_I
+from carfollow import A_MAX, A_MIN, S_0, S_0IDM
+
+try:
+    import numba
+except ImportError:  # Optional compiled backend
+    numba = None
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+GAMMA = 1 / (W_I * K_X)  # Spacing per unit of speed [s]
+BACKENDS = ("numpy", "numba")
+DEFAULT_BACKEND = "auto"  # numba if installed, numpy otherwise
+
+# ==============================================================================
+# Numpy kernels
+# ==============================================================================
+
+
+def shift_numpy(x_t, v_t, a_t, a) -> None:
+    """
+        Leader-follower state update x_{k-1} = x{k} (in place)
+    """
+    v = np.maximum(v_t + a * DT, 0)
+    x_t += v * DT
+    v_t[:] = v
+    a_t[:] = a
+
+
+def tampere_numpy(x_t, v_t, lead, fl, hd, c1, c2, c3, vd, noise, a) -> None:
+    """
+        Tampere acceleration (in place)
+
+        fl, hd: indices of followers and heads, noise: one value per follower
+    """
+    ld = lead[fl]
+    v_f = v_t[fl]
+    dv = v_t[ld] - v_f
+    s = x_t[ld] - x_t[fl]
+    s_d = S_0 + GAMMA * v_f
+    cong_acc = c1[fl] * dv + c2[fl] * (s - s_d)
+    free_acc = c3[fl] * (vd[fl] - v_f)
+    a[fl] = np.clip(np.minimum(cong_acc, free_acc) + noise, A_MIN, A_MAX)
+    a[hd] = np.clip(c3[hd] * (vd[hd] - v_t[hd]) / 4, A_MIN, A_MAX)
+
+
+def idm_numpy(x_t, v_t, lead, fl, hd, a_max, b, delta, vd, noise, a) -> None:
+    """
+        IDM acceleration (in place)
+
+        fl, hd: indices of followers and heads, noise: one value per follower
+    """
+    ld = lead[fl]
+    v_f = v_t[fl]
+    a_f = a_max[fl]
+    bs = v_f * (v_f - v_t[ld]) / (2 * np.sqrt(a_f * b[fl]))
+    s_d = S_0IDM + np.maximum(0, v_f * DT + bs)
+    s = x_t[ld] - x_t[fl]
+    acc = a_f * (1 - (v_f / vd[fl]) ** delta[fl] - (s_d / s) ** 2)
+    a[fl] = np.clip(acc + noise, A_MIN, A_MAX)
+    a[hd] = np.clip(a_max[hd] * (1 - (v_t[hd] / vd[hd]) ** delta[hd]), A_MIN, A_MAX)
+
+
+# ==============================================================================
+# Loop kernels (compiled by numba)
+# ==============================================================================
+
+
+def shift_loop(x_t, v_t, a_t, a) -> None:
+    """
+        Leader-follower state update x_{k-1} = x{k} (in place)
+    """
+    for i in range(x_t.shape[0]):
+        v = max(v_t[i] + a[i] * DT, 0.0)
+        x_t[i] = x_t[i] + v * DT
+        v_t[i] = v
+        a_t[i] = a[i]
+
+
+def tampere_loop(x_t, v_t, lead, fl, hd, c1, c2, c3, vd, noise, a) -> None:
+    """
+        Tampere acceleration (in place)
+
+        fl, hd: indices of followers and heads, noise: one value per follower
+    """
+    for k in range(fl.shape[0]):
+        i = fl[k]
+        j = lead[i]
+        dv = v_t[j] - v_t[i]
+        s = x_t[j] - x_t[i]
+        s_d = S_0 + GAMMA * v_t[i]
+        cong_acc = c1[i] * dv + c2[i] * (s - s_d)
+        free_acc = c3[i] * (vd[i] - v_t[i])
+        a[i] = max(A_MIN, min(min(cong_acc, free_acc) + noise[k], A_MAX))
+    for i in hd:
+        a[i] = max(A_MIN, min(c3[i] * (vd[i] - v_t[i]) / 4, A_MAX))
+
+
+def idm_loop(x_t, v_t, lead, fl, hd, a_max, b, delta, vd, noise, a) -> None:
+    """
+        IDM acceleration (in place)
+
+        fl, hd: indices of followers and heads, noise: one value per follower
+    """
+    for k in range(fl.shape[0]):
+        i = fl[k]
+        j = lead[i]
+        bs = v_t[i] * (v_t[i] - v_t[j]) / (2 * np.sqrt(a_max[i] * b[i]))
+        s_d = S_0IDM + max(0.0, v_t[i] * DT + bs)
+        s = x_t[j] - x_t[i]
+        acc = a_max[i] * (1 - (v_t[i] / vd[i]) ** delta[i] - (s_d / s) ** 2)
+        a[i] = max(A_MIN, min(acc + noise[k], A_MAX))
+    for i in hd:
+        a[i] = max(A_MIN, min(a_max[i] * (1 - (v_t[i] / vd[i]) ** delta[i]), A_MAX))
+
+
+# ==============================================================================
+# Car following laws
+# ==============================================================================
+
+# name: (numpy kernel, loop kernel, parameter names)
+LAWS = {
+    "Tampere": (tampere_numpy, tampere_loop, ("c1", "c2", "c3")),
+    "IDM": (idm_numpy, idm_loop, ("a_max", "b", "delta")),
+}
+
+
+def register_law(name: str, numpy_kernel, loop_kernel=None, params: tuple = ()) -> None:
+    """
+        Register a car following law, loop_kernel is compiled by numba
+        (numpy_kernel is used by every backend when it is not given)
+    """
+    LAWS[name] = (numpy_kernel, loop_kernel, tuple(params))
+
+
+# ==============================================================================
+# Backend selection
+# ==============================================================================
+
+
+class Kernels:
+    """
+        Set of kernels of a backend, law kernels are compiled on first use
+    """
+
+    def __init__(self, name: str, compiler=None) -> None:
+        self.name = name
+        self.compiler = compiler
+        self._laws = {}
+        self.shift = self.compile(shift_numpy, shift_loop)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name})"
+
+    def compile(self, numpy_kernel, loop_kernel):
+        """
+            Kernel of this backend
+        """
+        if self.compiler is None or loop_kernel is None:
+            return numpy_kernel
+        return self.compiler(loop_kernel)
+
+    def law(self, name: str):
+        """
+            Kernel of a registered car following law
+        """
+        if name not in self._laws:
+            if name not in LAWS:
+                raise ValueError(f"Unknown car following law {name}, choose among {tuple(LAWS)}")
+            numpy_kernel, loop_kernel, _ = LAWS[name]
+            self._laws[name] = self.compile(numpy_kernel, loop_kernel)
+        return self._laws[name]
+
+    @property
+    def tampere(self):
+        """
+            Tampere kernel
+        """
+        return self.law("Tampere")
+
+    @property
+    def idm(self):
+        """
+            IDM kernel
+        """
+        return self.law("IDM")
+
+
+_KERNELS = {"numpy": Kernels("numpy")}
+
+
+def available_backends() -> tuple:
+    """
+        Backends that can be used in this environment
+    """
+    return BACKENDS if numba is not None else ("numpy",)
+
+
+def select_backend(name: str = DEFAULT_BACKEND) -> Kernels:
+    """
+        Kernels of a backend, numba falls back to numpy when not installed
+    """
+    if name not in BACKENDS + ("auto",):
+        raise ValueError(f"Unknown backend {name}, choose among {BACKENDS}")
+    if name == "numpy" or numba is None:
+        return _KERNELS["numpy"]
+    if "numba" not in _KERNELS:
+        _KERNELS["numba"] = Kernels("numba", numba.njit(cache=True, nogil=True))
+    return _KERNELS["numba"]
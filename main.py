@@ -1,7 +1,11 @@
 #%%
 from carfollow import Tampere, W_I, U_I, K_X, A_MIN, A_MAX
-from support import speed_pulse
-from messages import Msg1, Msg2
+from support import tabulated_speed_pulse
+from messages import Msg1, Msg2, MessageScheduler, ACCEPT_MARGIN
+from fleet import FleetState, simulate
+from recorder import RecordingPolicy
+from noise import NoiseSource
+from streams import spawn_streams
 import numpy as np
 import pandas as pd
 
@@ -29,6 +33,8 @@ MPR = 0.1  # Market penetration rate
 
 MIN_DIST = 5000  # Minimum distance for acceptance
 
+SEED = 42  # Seed of the random streams of the run
+
 
 #%%
 # Capacity
@@ -44,12 +50,11 @@ TF = C * Q_PERC
 # Vehicle initializer
 X0 = np.flip(np.arange(0, N) * (W_I + U_I) / (W_I * K_X) * 1 / Q_PERC)
 V0 = np.ones(N) * U_I
-A0 = np.zeros(N)
 
 veh_list = []
 
-np.random.seed(42)  # Reproducibility
-ID_CAV = np.random.randint(1, N - 1, int(N * MPR))  # Id Connected Vehicles
+streams = spawn_streams(SEED)  # Reproducibility
+ID_CAV = streams["cav"].integers(1, N - 1, int(N * MPR))  # Id Connected Vehicles
 D_CLASS = {k: "CAV" for k in ID_CAV}
 V_CLASS = [D_CLASS.get(i, "HDV") for i in range(N)]  # All vehicle types
 
@@ -69,9 +74,9 @@ ID_CAVN = [i for i, j in enumerate(V_CLASS) if j == "CAV"]
 #%%
 # Scenario conditions
 D_ACCEPT = X_CONGESTION - 1000  # Broad casting messages @ 14Km
-D_ACCEPT = D_ACCEPT - np.random.exponential(PERCEP_RADIOUS, N * 1000)
+D_ACCEPT = D_ACCEPT - streams["accept"].exponential(PERCEP_RADIOUS, N * 1000)
 D_ACCEPT = D_ACCEPT[(D_ACCEPT > MIN_DIST) & (D_ACCEPT < X_CONGESTION)]
-D_ACCEPT = np.random.choice(D_ACCEPT, N)
+D_ACCEPT = streams["accept"].choice(D_ACCEPT, N)
 
 # msg_hist = plot_histogram(D_ACCEPT, "Message Position [m]")
 # show(msg_hist)
@@ -84,7 +89,7 @@ def lead_spd(x):
          Position: 15 Km
          Duration: 20 Km
     """
-    return speed_pulse(x, drop=20, delay=X_CONGESTION, duration=L_CONGESTION)
+    return tabulated_speed_pulse(drop=20, delay=X_CONGESTION, duration=L_CONGESTION)(x)
 
 
 x_t = np.linspace(0, 20000, 20000)
@@ -134,33 +139,28 @@ v_t = lead_spd(x_t)
 
 #%%
 # Dynamical evalution
-X = X0
-V = V0
-A = A0
-
 send_message = Msg2  # Msg2 # Defines the type of message to be send
 
 d_accept = X_CONGESTION - 1000
-msg_fix = send_message(d_accept)
-
-for t in time:
-    for veh in veh_list:
-        if veh.type == "CAV" and not veh.acc:
-            d_accept = D_ACCEPT[veh.idx]
-            msg = send_message(d_accept)
-            veh.register_control_speed(msg)
-        elif veh.type == "HDV" and not veh.acc:
-            veh.register_control_speed(msg_fix)
-
-        veh.step_evolution(control=lead_spd)
-
-    V = np.vstack((V, np.array([veh.v for veh in veh_list])))
-    X = np.vstack((X, np.array([veh.x for veh in veh_list])))
-    A = np.vstack((A, np.array([veh.a for veh in veh_list])))
-
-V = V[1:, :]
-X = X[1:, :]
-A = A[1:, :]
+msg_fix = send_message(d_accept).tabulated
+
+fleet = FleetState.from_vehicles(veh_list)
+fleet.noise = NoiseSource(N - 1, rng=streams["noise"])
+
+# Messages are delivered when vehicles reach their acceptance point
+scheduler = MessageScheduler()
+id_hdv = np.flatnonzero(fleet.type == "HDV")
+scheduler.register(id_hdv, msg_fix, position=d_accept - ACCEPT_MARGIN)
+id_cav = np.flatnonzero(fleet.type == "CAV")
+d_cav = D_ACCEPT[fleet.idx[id_cav]]
+msg_cav = [send_message(d).tabulated for d in d_cav]
+scheduler.register(id_cav, msg_cav, position=d_cav - ACCEPT_MARGIN)
+
+recorder = simulate(
+    fleet, len(time), control=lead_spd, policy=RecordingPolicy(), scheduler=scheduler
+)
+
+X, V, A = recorder.X, recorder.V, recorder.A
 
 #%%
 # Creating plots
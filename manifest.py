@@ -0,0 +1,67 @@
+"""
+    Result manifest
+
+    Every output file of a case (PHEM CSV, trajectories, spacing) is listed
+    in the manifest of its folder with the case parameters, so
+    post-processing finds and filters cases without globbing folders and
+    parsing filenames. Lines are only appended (one write per case), several
+    processes can record at once and the last entry of a case and kind wins.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import os
+
+import pandas as pd
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+MANIFEST = "manifest.csv"  # Manifest name inside an output folder
+KEYS = ("mpr", "q_perc", "distance", "seed")
+COLUMNS = KEYS + ("kind", "filename")
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def record_outputs(folder: str, case: dict, outputs: dict) -> None:
+    """
+        Append the outputs {kind: filename} of a case (KEYS values) to the
+        manifest of folder, filenames are stored relative to folder
+    """
+    values = [str(case[key]) for key in KEYS]
+    lines = "".join(
+        ",".join(values + [kind, os.path.relpath(filename, folder)]) + "\n"
+        for kind, filename in outputs.items()
+    )
+    with open(os.path.join(folder, MANIFEST), "a") as manifest:
+        manifest.write(lines)
+
+
+def read_manifest(folder: str, kind: str = None, **where) -> pd.DataFrame:
+    """
+        Outputs of folder, filtered by kind and case parameters
+        (column=value or column=sequence of values). Filenames include folder.
+    """
+    filename = os.path.join(folder, MANIFEST)
+    if not os.path.exists(filename):
+        return pd.DataFrame(columns=COLUMNS)
+    unknown = set(where) - set(KEYS)
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, choose among {KEYS}")
+    df = pd.read_csv(filename, names=COLUMNS)
+    df = df.drop_duplicates(subset=list(KEYS) + ["kind"], keep="last")
+    mask = pd.Series(True, index=df.index)
+    if kind is not None:
+        mask &= df["kind"].eq(kind)
+    for name, value in where.items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        mask &= df[name].isin(values)
+    df = df[mask].reset_index(drop=True)
+    df["filename"] = [os.path.join(folder, name) for name in df["filename"]]
+    return df
@@ -6,7 +6,9 @@
 # Imports
 # ==============================================================================
 
-from support import speed_pulse, speed_drop
+import numpy as np
+
+from support import speed_pulse, speed_drop, tabulated_speed_pulse, tabulated_speed_drop
 
 from carfollow import U_I
 
@@ -17,6 +19,7 @@ from carfollow import U_I
 
 SPEED_REDUCTION = 5.5  # Amount of speed reduction [m/s]
 X_CONGESTION = 15000  # Position of congestion in space [m]
+ACCEPT_MARGIN = 500  # Delivery ahead of the message distance, 10 sigmoid widths [m]
 
 # ==============================================================================
 # Clases
@@ -60,6 +63,11 @@ class Msg1:
     def __call__(self, x):
         return msg_spd(x, self.distance)
 
+    @property
+    def tabulated(self):
+        """ Tabulated message shared by all messages with same distance"""
+        return tabulated_speed_drop(v0=U_I, drop=SPEED_REDUCTION, delay=self.distance)
+
 
 class Msg2:
     """ Creates a random message 2 for a vehicle"""
@@ -69,3 +77,100 @@ class Msg2:
 
     def __call__(self, x):
         return msg_pls(x, self.distance)
+
+    @property
+    def tabulated(self):
+        """ Tabulated message shared by all messages with same distance"""
+        return tabulated_speed_pulse(
+            v0=U_I,
+            drop=SPEED_REDUCTION,
+            delay=self.distance,
+            duration=X_CONGESTION - self.distance + 1500,
+        )
+
+
+class MessageScheduler:
+    """ Message deliveries fired when vehicles cross their acceptance point
+
+        Each event is (vehicle, position, time, message). An event fires on the
+        first step where the vehicle position reaches position or the step
+        reaches time. The cost of a step depends on the pending events only.
+
+        For Msg1/Msg2 with distance d, delivering at d - ACCEPT_MARGIN instead
+        of t=0 changes the desired speed by less than 3e-4 m/s.
+    """
+
+    def __init__(self):
+        self.veh = np.empty(0, dtype=int)
+        self.position = np.empty(0)
+        self.time = np.empty(0)
+        self.pid = np.empty(0, dtype=int)
+        self.messages = []
+
+    def __len__(self) -> int:
+        """ Number of pending events"""
+        return len(self.veh)
+
+    def register(self, veh, message, position=np.inf, time=np.inf) -> None:
+        """ Register deliveries for vehicle index(es) veh
+
+            message: a message for all vehicles or a sequence with one per vehicle
+        """
+        veh = np.atleast_1d(veh)
+        if isinstance(message, (list, tuple)):
+            pid = np.arange(len(self.messages), len(self.messages) + len(message))
+            self.messages.extend(message)
+        else:
+            pid = np.full(len(veh), len(self.messages))
+            self.messages.append(message)
+        self.veh = np.concatenate((self.veh, veh))
+        self.position = np.concatenate((self.position, np.broadcast_to(position, veh.shape)))
+        self.time = np.concatenate((self.time, np.broadcast_to(time, veh.shape)))
+        self.pid = np.concatenate((self.pid, pid))
+
+    def checkpoint(self) -> dict:
+        """ Pending events"""
+        return dict(
+            veh=self.veh, position=self.position, time=self.time, pid=self.pid, n=len(self.messages)
+        )
+
+    def restore(self, state: dict) -> None:
+        """ Pending events of a checkpoint (arrays are never modified in place)"""
+        self.veh, self.position = state["veh"], state["position"]
+        self.time, self.pid = state["time"], state["pid"]
+        del self.messages[state["n"] :]
+
+    def merge(self, other: "MessageScheduler") -> "MessageScheduler":
+        """ New scheduler with the pending events of both"""
+        merged = MessageScheduler()
+        for sched in (self, other):
+            merged.veh = np.concatenate((merged.veh, sched.veh))
+            merged.position = np.concatenate((merged.position, sched.position))
+            merged.time = np.concatenate((merged.time, sched.time))
+            merged.pid = np.concatenate((merged.pid, sched.pid + len(merged.messages)))
+            merged.messages.extend(sched.messages)
+        return merged
+
+    def due(self, fleet, t: int) -> np.ndarray:
+        """ Pending events reached at step t, sleeping vehicles of an active
+            set fleet are first advanced to the step (O(pending events))
+        """
+        if getattr(fleet, "active", None) is not None:
+            veh = self.veh[~fleet.active[self.veh]]
+            fleet.advance_sleeping(np.unique(veh))
+        return (fleet.x_t[self.veh] >= self.position) | (t >= self.time)
+
+    def fire(self, fleet, t: int) -> int:
+        """ Deliver due messages to the fleet, returns the number of fired events"""
+        if not len(self):
+            return 0
+        fired = self.due(fleet, t)
+        if not fired.any():
+            return 0
+        veh, pid = self.veh[fired], self.pid[fired]
+        for p in np.unique(pid):
+            fleet.register_control_speed(veh[pid == p], self.messages[p])
+        keep = ~fired
+        self.veh, self.position = self.veh[keep], self.position[keep]
+        self.time, self.pid = self.time[keep], self.pid[keep]
+        return len(veh)
@@ -11,6 +11,8 @@ from collections import deque, abc
 
 import networkx as nx
 
+from fleet import SlotPool
+
 
 # ==============================================================================
 # Constants
@@ -26,22 +28,31 @@ class TrafficLane:
 
     __idx = count(0)  # Lane ID
 
-    __slots__ = ["length", "veh_list", "idx"]
+    __slots__ = ["length", "veh_list", "idx", "pool"]
 
     def __init__(self, length: float = L_MAX) -> None:
         self.idx = next(self.__class__.__idx)
         self.length = length
         self.veh_list = deque([])
+        self.pool = None
 
     def attach_vehicle(self, vehicle) -> None:
-        """ Attach a vehicle a vehicle to a lane"""
+        """ Attach a vehicle at the upstream end of the lane"""
+        vehicle.set_leader(self.veh_list[-1] if self.veh_list else None)
         self.veh_list.append(vehicle)
-        vehicle.veh_leader.set_leader(self.veh_list[-1])
 
-    def detach_vehicle(self) -> None:
-        """ Detach head vehicle a vehicle from the  lane"""
-        self.veh_list[1].control = self.veh_list[0].control
-        self.veh_list.pop()
+    def detach_vehicle(self):
+        """ Detach head vehicle from the lane, its follower takes the control"""
+        head = self.veh_list.popleft()
+        if self.veh_list:
+            self.veh_list[0].control = head.control
+            self.veh_list[0].set_leader(None)
+        return head
+
+    def open_pool(self, capacity: int, **kwargs) -> SlotPool:
+        """ Fixed capacity slot pool for vehicles entering and leaving the lane"""
+        self.pool = SlotPool(capacity, self.length, **kwargs)
+        return self.pool
 
 
 class TrafficLink(abc.MutableMapping):
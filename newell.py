@@ -0,0 +1,175 @@
+"""
+    Newell simplified car following engine
+
+    With a triangular fundamental diagram (U_I, W_I, K_X) a follower repeats
+    the trajectory of its leader shifted by TAU in time and DELTA_X in space.
+    Since DT = TAU the shift is exactly one time step.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+from vehicles import DT, K_X, U_I, W_I
+from support import ProfileBank, TabulatedProfile
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+TAU = 1 / (W_I * K_X)  # Time shift [s]
+DELTA_X = 1 / K_X  # Space shift (jam spacing) [m]
+NO_CAP = -1  # Cap index of a vehicle without message
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class Newell:
+    """
+        Newell car following for a single lane platoon (head first).
+
+        Follower i moves at its desired speed unless constrained by the
+        shifted trajectory of its leader:
+
+            x_i(t + TAU) = min(x_i(t) + vd_i(x_i) TAU, x_{i-1}(t) - DELTA_X)
+
+        Messages act as desired speed caps vd_i(x) = min(U_I, msg(x)). The head
+        trajectory is given, see leader_trajectory.
+
+        To initialize a platoon
+
+        Newell(x0).run(x_lead)
+
+    """
+
+    def __init__(self, x0: np.ndarray, u: float = U_I) -> None:
+        self.x_t = np.array(x0, dtype=float)
+        self.u = u
+        self.cap = np.full(len(self.x_t), NO_CAP)  # Bank index or callable group
+        self.bank = ProfileBank()  # Tabulated caps
+        self._callables = []
+
+    @classmethod
+    def from_fleet(cls, fleet) -> "Newell":
+        """
+            Platoon with the positions and registered controls of a fleet
+        """
+        newell = cls(fleet.x_t)
+        for pid, control in enumerate(fleet._controls):
+            idx = np.flatnonzero(fleet.profile == pid)
+            if len(idx):
+                newell.register_control_speed(idx, control)
+        return newell
+
+    def __len__(self) -> int:
+        """ Number of vehicles"""
+        return len(self.x_t)
+
+    def register_control_speed(self, idx, control) -> None:
+        """
+            Register a desired speed cap for vehicle(s) idx
+        """
+        control = getattr(control, "tabulated", control)  # Msg1 / Msg2
+        if isinstance(control, TabulatedProfile):
+            self.cap[idx] = self.bank.index(control)
+        else:
+            self._callables.append(control)
+            self.cap[idx] = -1 - len(self._callables)  # -2, -3, ...
+
+    @property
+    def capped(self) -> bool:
+        """
+            True if any vehicle has a speed cap
+        """
+        return bool(np.any(self.cap != NO_CAP))
+
+    def desired_speed(self, x: np.ndarray) -> np.ndarray:
+        """
+            Desired speed of every vehicle at positions x
+        """
+        vd = np.full(len(x), float(self.u))
+        tab = self.cap >= 0
+        if tab.any():
+            vd[tab] = self.bank.evaluate(self.cap[tab], x[tab])
+        for k, control in enumerate(self._callables):
+            sel = self.cap == -2 - k
+            if sel.any():
+                vd[sel] = control(x[sel])
+        return np.minimum(vd, self.u)
+
+    def shift(self, x_lead: np.ndarray) -> np.ndarray:
+        """
+            Lag-shift of every follower on its leader trajectory (no caps)
+
+            x_i(k) = max_{j<=k} min(x_i(0) + u k DT, x_{i-1}(j - 1) - DELTA_X)
+        """
+        n_steps = len(x_lead) - 1
+        X = np.empty((n_steps + 1, len(self)))
+        X[:, 0] = x_lead
+        free = self.u * DT * np.arange(n_steps + 1)
+        for i in range(1, len(self)):
+            X[0, i] = self.x_t[i]
+            X[1:, i] = np.minimum(self.x_t[i] + free[1:], X[:-1, i - 1] - DELTA_X)
+            np.maximum.accumulate(X[:, i], out=X[:, i])
+        return X
+
+    def march(self, x_lead: np.ndarray, scheduler=None) -> np.ndarray:
+        """
+            Time marching of the whole platoon with speed caps
+
+            The scheduler (MessageScheduler) delivers messages before each step
+        """
+        n_steps = len(x_lead) - 1
+        X = np.empty((n_steps + 1, len(self)))
+        X[0] = self.x_t
+        X[0, 0] = x_lead[0]
+        for k in range(n_steps):
+            self.x_t = X[k]
+            if scheduler is not None:
+                scheduler.fire(self, k)
+            x = X[k, 1:]
+            free = x + self.desired_speed(X[k])[1:] * DT
+            X[k + 1, 1:] = np.maximum(np.minimum(free, X[k, :-1] - DELTA_X), x)
+            X[k + 1, 0] = x_lead[k + 1]
+        self.x_t = X[-1]
+        return X
+
+    def run(self, x_lead: np.ndarray, scheduler=None) -> np.ndarray:
+        """
+            Trajectories (steps + 1, vehicles) for the head trajectory x_lead
+        """
+        x_lead = np.asarray(x_lead, dtype=float)
+        if self.capped or scheduler is not None:
+            return self.march(x_lead, scheduler)
+        X = self.shift(x_lead)
+        self.x_t = X[-1].copy()
+        return X
+
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def leader_trajectory(x0: float, n_steps: int, control=U_I) -> np.ndarray:
+    """
+        Head trajectory at the desired speed control(x) (callable or constant)
+    """
+    if not callable(control):
+        return x0 + min(control, U_I) * DT * np.arange(n_steps + 1)
+    x = np.empty(n_steps + 1)
+    x[0] = x0
+    for k in range(n_steps):
+        x[k + 1] = x[k] + min(float(control(x[k])), U_I) * DT
+    return x
+
+
+def trajectory_speed(X: np.ndarray) -> np.ndarray:
+    """
+        Speeds (steps, vehicles) of trajectories (steps + 1, vehicles)
+    """
+    return np.diff(X, axis=0) / DT
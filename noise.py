@@ -0,0 +1,178 @@
+"""
+    Stochastic acceleration noise
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+from carfollow import SIGMA_A
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+BLOCK_STEPS = 256  # Steps drawn at once
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class NoiseSource:
+    """
+        Per-run driver noise drawn by (steps, vehicles) blocks.
+
+        Row k of the noise is the term of step k for every vehicle, whatever
+        the order in which vehicles are evaluated. With store=True all drawn
+        rows are kept so that the run can be replayed without re-drawing.
+
+        To initialize a source
+
+        NoiseSource(n_vehicles, rng=np.random.default_rng(seed))
+
+    """
+
+    def __init__(
+        self,
+        n_vehicles: int,
+        sigma: float = SIGMA_A,
+        block: int = BLOCK_STEPS,
+        rng=None,
+        store: bool = False,
+    ) -> None:
+        self.n_vehicles = n_vehicles
+        self.sigma = sigma
+        self.block = block
+        self.rng = rng if rng is not None else np.random  # Global stream by default
+        self.stored = [] if store else None
+        self.step = 0  # Rows handed out
+        self._rows = np.empty((0, n_vehicles))
+        self._k = 0
+
+    @classmethod
+    def replay(cls, rows: np.ndarray) -> "NoiseSource":
+        """
+            Source handing out previously recorded rows (steps, vehicles)
+        """
+        rows = np.asarray(rows)
+        source = cls(rows.shape[1], block=0)
+        source._rows = rows
+        return source
+
+    @classmethod
+    def load(cls, filename: str) -> "NoiseSource":
+        """
+            Replay a noise record saved with save
+        """
+        return cls.replay(np.load(filename, mmap_mode="r"))
+
+    def checkpoint(self) -> dict:
+        """
+            State of the source, including the generator state
+        """
+        if isinstance(self.rng, np.random.Generator):
+            rng_state = self.rng.bit_generator.state
+        else:
+            rng_state = self.rng.get_state()  # RandomState or np.random
+        stored = None if self.stored is None else list(self.stored)
+        return dict(rng=rng_state, rows=self._rows, k=self._k, step=self.step, stored=stored)
+
+    def restore(self, state: dict) -> None:
+        """
+            Continue from a checkpoint, rows are never modified in place
+        """
+        if isinstance(self.rng, np.random.Generator):
+            self.rng.bit_generator.state = state["rng"]
+        else:
+            self.rng.set_state(state["rng"])
+        self._rows, self._k, self.step = state["rows"], state["k"], state["step"]
+        self.stored = None if state["stored"] is None else list(state["stored"])
+
+    def draw_block(self) -> None:
+        """
+            Draw the next block of rows
+        """
+        if not self.block:
+            raise IndexError(f"Replayed noise exhausted after {self.step} steps")
+        shape = (self.block, self.n_vehicles)
+        if self.sigma:
+            self._rows = self.rng.normal(0, self.sigma, shape)
+        else:
+            self._rows = np.broadcast_to(0.0, shape)  # Noise-free: nothing to draw
+        self._k = 0
+        if self.stored is not None:
+            self.stored.append(self._rows)
+
+    def draw(self) -> np.ndarray:
+        """
+            Noise of the next step, one value per vehicle
+        """
+        if self._k == len(self._rows):
+            self.draw_block()
+        row = self._rows[self._k]
+        self._k += 1
+        self.step += 1
+        return row
+
+    @property
+    def record(self) -> np.ndarray:
+        """
+            Rows handed out so far (steps, vehicles), requires store=True
+        """
+        if self.stored is None:
+            raise ValueError("Noise is not stored, create the source with store=True")
+        if not self.stored:
+            return np.empty((0, self.n_vehicles))
+        return np.concatenate(self.stored)[: self.step]
+
+    def save(self, filename: str) -> None:
+        """
+            Save the rows handed out so far (.npy)
+        """
+        np.save(filename, self.record)
+
+
+class NoiseStack:
+    """
+        Noise of an ensemble: concatenation of the rows of its members' sources.
+        Each member keeps its own stream, so ensemble and serial runs match.
+    """
+
+    def __init__(self, sources: list) -> None:
+        self.sources = sources
+
+    @property
+    def sigma(self) -> float:
+        """
+            Largest standard deviation of the members
+        """
+        return max(source.sigma for source in self.sources)
+
+    @property
+    def step(self) -> int:
+        """
+            Rows handed out
+        """
+        return self.sources[0].step
+
+    def checkpoint(self) -> list:
+        """
+            State of every member source
+        """
+        return [source.checkpoint() for source in self.sources]
+
+    def restore(self, state: list) -> None:
+        """
+            Continue from a checkpoint
+        """
+        for source, member in zip(self.sources, state):
+            source.restore(member)
+
+    def draw(self) -> np.ndarray:
+        """
+            Noise of the next step, one value per vehicle
+        """
+        return np.concatenate([source.draw() for source in self.sources])
@@ -0,0 +1,108 @@
+"""
+    PHEM export
+
+    Trajectories are written to the PHEM CSV while the simulation runs, by
+    chunks of CHUNK_ROWS rows, so the export memory does not depend on the
+    fleet size or the horizon.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+from recorder import FLEET_CHANNELS
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+PHEM_COLUMNS = (
+    "time",
+    "vehicle number",
+    "x",
+    "y",
+    "speed",
+    "road inclination",
+    "vehicle type",
+    "segment number",
+)
+PHEM_FORMAT = ("%d", "%d", "%.3f", "%d", "%.3f", "%d", "%d", "%d")
+CHUNK_ROWS = 65536  # Rows written at once
+VEHICLE_TYPE = 100  # PHEM vehicle type of all vehicles
+MS_TO_KMH = 3.6
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class PhemExporter:
+    """
+        Simulation observer writing the PHEM CSV (one row per vehicle and step)
+
+        To export a run
+
+        with PhemExporter("phem.csv", len(fleet)) as phem:
+            simulate(fleet, n_steps, observers=(phem,))
+
+    """
+
+    def __init__(self, filename: str, n_vehicles: int, chunk_rows: int = CHUNK_ROWS) -> None:
+        self.filename = filename
+        self.n_vehicles = n_vehicles
+        self.chunk = max(chunk_rows // max(n_vehicles, 1), 1)  # Steps per chunk
+        self._x = np.empty((self.chunk, n_vehicles))
+        self._v = np.empty((self.chunk, n_vehicles))
+        self._k = 0  # Buffered steps
+        self.step = 0  # Steps received
+        self._file = open(filename, "w")
+        self._file.write(",".join(PHEM_COLUMNS) + "\n")
+
+    def __enter__(self) -> "PhemExporter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, x: np.ndarray, v: np.ndarray) -> None:
+        """
+            Buffer the positions and speeds [m/s] of a step
+        """
+        self._x[self._k] = x
+        self._v[self._k] = v
+        self._k += 1
+        self.step += 1
+        if self._k == self.chunk:
+            self.flush()
+
+    def record_fleet(self, fleet) -> None:
+        """
+            Buffer the state of a FleetState
+        """
+        self.record(FLEET_CHANNELS["x"](fleet), FLEET_CHANNELS["v"](fleet))
+
+    def flush(self) -> None:
+        """
+            Write the buffered steps
+        """
+        if not self._k:
+            return
+        steps, n = self._k, self.n_vehicles
+        rows = np.zeros((steps * n, len(PHEM_COLUMNS)))
+        rows[:, 0] = np.repeat(np.arange(self.step - steps, self.step), n)
+        rows[:, 1] = np.tile(np.arange(n), steps)
+        rows[:, 2] = self._x[:steps].ravel()
+        rows[:, 4] = self._v[:steps].ravel() * MS_TO_KMH
+        rows[:, 6] = VEHICLE_TYPE
+        np.savetxt(self._file, rows, fmt=PHEM_FORMAT, delimiter=",")
+        self._k = 0
+
+    def close(self) -> None:
+        """
+            Write the remaining steps and close the file
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
@@ -17,56 +17,55 @@ from matplotlib import rc
 rc("font", **{"family": "serif", "serif": ["Times"]})
 rc("text", usetex=True)
 
-from glob import glob
-import re
+from manifest import read_manifest
+from store import MODEL_VERSION, IndicatorStore
 
 # ==============================================================================
 # Constants
 # ==============================================================================
 
 ddir_lst = ["data/eu4dpfmix_mpr0.csv", "data/eu4dpfmix.csv"]
+SEED = 42  # Seed of the sweep runs
+BASELINE_KEYS = ("flow", "distance", "veh_id", "seed")  # Case matched by the baseline
+CSVDIR = "data/csv/"  # Simulation outputs and their manifest
+CYCLE_PATTERN = r"^(?P<veh_id>\d+)-.*mpr-(?P<mpr>[\d.]+)_q-(?P<flow>[\d.]+)_d-(?P<distance>\d+)"
 
 # ==============================================================================
 # Functions
 # ==============================================================================
 
 
-def column_generator(data_frame):
-    """ 
-        Create supplementary columns 
+def parse_cycle(cycle: pd.Series) -> pd.DataFrame:
     """
-
-    str_splt = data_frame["Cycle"].split("-")
-    veh_id = int(str_splt[0])
-    mpr = float(str_splt[2].split("_")[0])
-    flow = float(str_splt[3].split("_")[0])
-    distance = int(str_splt[4].split(".dri")[0])
-    return pd.Series([veh_id, mpr, flow, distance])
+        Case columns (veh_id, mpr, flow, distance) of PHEM Cycle names
+        (<veh_id>-phem_mpr-<mpr>_q-<flow>_d-<distance>.dri)
+    """
+    fields = cycle.str.extract(CYCLE_PATTERN)
+    return fields.astype({"veh_id": int, "mpr": float, "flow": float, "distance": int})
 
 
-def create_columns(data_frame, function):
+def create_columns(data_frame):
     """
-        Apply function to dataframe 
+        Add the case columns parsed from Cycle
     """
     fields = ["veh_id", "mpr", "flow", "distance"]
-    data_frame[fields] = data_frame.apply(function, axis=1)
+    data_frame[fields] = parse_cycle(data_frame["Cycle"])
     return data_frame
 
 
-def refer_to_mpr(data_frame, field, new_field):
+def refer_to_mpr(data_frame, fields, mpr=0, keys=BASELINE_KEYS):
     """
-        Refer to MPR 0 %
+        Change [%] of fields {field: new_field} with respect to the case
+        MPR = mpr sharing the same keys (those present in data_frame)
     """
-    # Create reference data_frame
-
-    reference = data_frame[data_frame["mpr"].eq(0)]
-    reference = pd.concat([reference] * 5).reset_index()
-    reference = reference.drop("index", axis=1)
+    keys = [key for key in keys if key in data_frame]
+    reference = data_frame.loc[data_frame["mpr"].eq(mpr), keys + list(fields)]
+    reference = data_frame[keys].merge(reference, on=keys, how="left", validate="many_to_one")
 
     # Compute difference
-    diff_df = reference[field] - data_frame[field]
-    # diff_df = diff_df.reset_index()
-    data_frame[new_field] = (diff_df.divide(reference[field])) * 100
+    for field, new_field in fields.items():
+        ref = reference[field].to_numpy()
+        data_frame[new_field] = (ref - data_frame[field].to_numpy()) / ref * 100
 
     # Round for results
     data_frame = data_frame.round(3)
@@ -426,7 +425,7 @@ co2_df = pd.concat([x.filter(items=sel_cols) for x in dflst])
 co2_df = co2_df.reset_index()
 
 # Create supplementary columns
-co2_df = create_columns(co2_df, column_generator)
+co2_df = create_columns(co2_df)
 co2_df = co2_df.filter(items=["CO2_TP", "veh_id", "mpr", "flow", "distance"])
 
 # Replace values
@@ -434,7 +433,7 @@ co2_df["mpr"] = co2_df["mpr"] * 100  # Flow
 co2_df["flow"] = co2_df["flow"] * 2880
 
 # Refer data to MPR 0%
-co2prc_df = refer_to_mpr(co2_df, "CO2_TP", "CO2 %")
+co2prc_df = refer_to_mpr(co2_df, {"CO2_TP": "CO2 %"})
 
 # Plot CO 2 % vs Flow
 figco2, axco2 = plot_co2(co2prc_df)
@@ -447,97 +446,90 @@ plt.savefig("data/img/summary/CO2%vsFlow.png")
 # Travel Time
 # ==============================================================================
 
-# Import csv files
-tt_df = pd.read_csv(
-    "data/Indicators.csv",
-    names=["mpr", "flow", "distance", "meanTT", "stdTT", "totalTT", "timetC"],
+# Import indicators (one row per case)
+tt_df = IndicatorStore().read(
+    columns=("mpr", "q", "distance", "seed", "meanTT", "totalTT", "TTC"),
+    seed=SEED,
+    version=MODEL_VERSION,
 )
+tt_df = tt_df.rename(columns={"q": "flow", "TTC": "timetC"})
+tt_df = tt_df.sort_values(["mpr", "distance", "flow"]).reset_index(drop=True)
 
 # Replace values
-tt_df = tt_df.drop_duplicates()
 tt_df["flow"] = tt_df["flow"] * 3600
 
 # Refer to data MPR 0%
-avgtt_df = refer_to_mpr(tt_df, "meanTT", "avgTT %")
-tottt_df = refer_to_mpr(tt_df, "totalTT", "totTT %")
-timtc_df = refer_to_mpr(tt_df, "timetC", "timeTC %")
+tt_df = refer_to_mpr(tt_df, {"meanTT": "avgTT %", "totalTT": "totTT %", "timetC": "timeTC %"})
 
 # Average Travel Time
 # ==============================================================================
 
 # Plot Avg TT vs Flow
-figmtt, axmtt = plot_mtt(avgtt_df)
+figmtt, axmtt = plot_mtt(tt_df)
 plt.savefig("data/img/summary/avgTTvsFlow.png")
 
 # Plot Avg TT % Change vs Flow
-figmttprc, axmttprc = plot_mttperc(avgtt_df)
+figmttprc, axmttprc = plot_mttperc(tt_df)
 plt.savefig("data/img/summary/avgTT%vsFlow.png")
 
 # Plot Avg TT vs distance
-figmttd, axmttd = plot_mttd(avgtt_df)
+figmttd, axmttd = plot_mttd(tt_df)
 plt.savefig("data/img/summary/avgTTvsDistance.png")
 
 # Plot Avg TT % Change vs distance
-figmttdprc, axmttdprc = plot_mttdprc(avgtt_df)
+figmttdprc, axmttdprc = plot_mttdprc(tt_df)
 plt.savefig("data/img/summary/avgTT%vsDistance.png")
 
 # Total Travel Time
 # ==============================================================================
 
 # Plot total TT vs Flow
-figttt, axttt = plot_ttt(tottt_df)
+figttt, axttt = plot_ttt(tt_df)
 plt.savefig("data/img/summary/totalTTvsFlow.png")
 
 # Plot total TT % Change vs Flow
-figtttprc, axtttprc = plot_tttprc(tottt_df)
+figtttprc, axtttprc = plot_tttprc(tt_df)
 plt.savefig("data/img/summary/totalTT%vsFlow.png")
 
 # Plot total TT vs distance
-figtttd, axtttd = plot_tttd(tottt_df)
+figtttd, axtttd = plot_tttd(tt_df)
 plt.savefig("data/img/summary/totalTTvsDistance.png")
 
 # Plot total TT % Change vs distance
-figtttdprc, axtttdprc = plot_tttdprc(tottt_df)
+figtttdprc, axtttdprc = plot_tttdprc(tt_df)
 plt.savefig("data/img/summary/totalTT%vsDistance.png")
 
 # Time to Collision
 # ==============================================================================
 
 # Plot total TT vs Flow
-figttc, axttc = plot_ttc(timtc_df)
+figttc, axttc = plot_ttc(tt_df)
 plt.savefig("data/img/summary/timeTCvsFlow.png")
 
 # Plot total TT % Change vs Flow
-figttcprc, axttcprc = plot_ttcprc(timtc_df)
+figttcprc, axttcprc = plot_ttcprc(tt_df)
 plt.savefig("data/img/summary/timeTC%vsFlow.png")
 
 # Plot total TT vs distance
-figttcd, axttcd = plot_ttcd(timtc_df)
+figttcd, axttcd = plot_ttcd(tt_df)
 plt.savefig("data/img/summary/timeTCvsDistance.png")
 
 # Plot total TT % Change vs distance
-figttcdprc, axttcdprc = plot_ttcdprc(timtc_df)
+figttcdprc, axttcdprc = plot_ttcdprc(tt_df)
 plt.savefig("data/img/summary/timeTC%vsDistance.png")
 
 # Headway space
 # ==============================================================================
 
-files = glob("data/csv/spacing_*.csv")
+# Spacing files of the cases with Q = 1 (manifest written by the simulation)
+spacing = read_manifest(CSVDIR, kind="spacing", q_perc=1)
 df_list = []
 
-# Pattern to recover x-0.1
-pattern = re.compile(r"[a-z]*-\d*[.]?\d*")
-
-for file in files:
-    tmp = pd.read_csv(file, names=["time", "hwy"])
-    lst_raw = pattern.findall(file.split(".csv")[0])
-    dct_prop = {
-        prop.split("-")[0]: float(prop.split("-")[1]) for prop in lst_raw
-    }
-
-    tmp["mpr"] = dct_prop["mpr"]
-    tmp["flow"] = dct_prop["q"]
-    tmp["distance"] = dct_prop["d"]
+for case in spacing.itertuples():
+    tmp = pd.read_csv(case.filename, names=["time", "hwy"])
+    tmp["mpr"] = case.mpr
+    tmp["flow"] = case.q_perc
+    tmp["distance"] = case.distance
 
     df_list.append(tmp)
 
@@ -0,0 +1,239 @@
+"""
+    Trajectory recorder
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+from copy import copy
+from operator import itemgetter
+
+import numpy as np
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+CHUNK_STEPS = 1024  # Buffer growth when the horizon is unknown [steps]
+CHANNELS = ("x", "v", "a", "control")  # Recordable channels
+
+# Channel getters on a FleetState (control is the desired speed)
+FLEET_CHANNELS = {
+    "x": lambda fleet: fleet.x,
+    "v": lambda fleet: fleet.v,
+    "a": lambda fleet: fleet.a,
+    "control": lambda fleet: fleet.vd,
+}
+
+# Channel getters on a list of vehicles
+VEHICLE_CHANNELS = {
+    "x": lambda veh_list: [veh.x for veh in veh_list],
+    "v": lambda veh_list: [veh.v for veh in veh_list],
+    "a": lambda veh_list: [veh.a for veh in veh_list],
+    "control": lambda veh_list: [veh.vd for veh in veh_list],
+}
+
+# Channel getters on a dictionary of arrays
+ARRAY_CHANNELS = {ch: itemgetter(ch) for ch in CHANNELS}
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class RecordingPolicy:
+    """
+        What to record during a simulation.
+
+        every: record one step out of every
+        vehicles: None (all), a vehicle type ("CAV", "HDV") or vehicle ids
+        channels: subset of CHANNELS
+
+        To initialize a policy
+
+        RecordingPolicy(every=10, vehicles="CAV", channels=("x", "v"))
+
+    """
+
+    def __init__(self, every: int = 1, vehicles=None, channels: tuple = ("x", "v", "a")) -> None:
+        unknown = set(channels) - set(CHANNELS)
+        if unknown:
+            raise ValueError(f"Unknown channels {unknown}, choose among {CHANNELS}")
+        self.every = every
+        self.vehicles = vehicles
+        self.channels = tuple(channels)
+
+    def columns(self, fleet) -> np.ndarray:
+        """
+            Recorded columns of a fleet (None means all)
+        """
+        if self.vehicles is None:
+            return None
+        if isinstance(self.vehicles, str):
+            return np.flatnonzero(fleet.type == self.vehicles)
+        return np.flatnonzero(np.isin(fleet.idx, self.vehicles))
+
+    def n_records(self, n_steps: int) -> int:
+        """
+            Number of recorded steps over a horizon
+        """
+        return -(-n_steps // self.every)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.every},{self.vehicles},{self.channels})"
+
+
+class TrajectoryRecorder:
+    """
+        Preallocated (T, N) buffers for the recorded channels.
+
+        Buffers grow by chunks of CHUNK_STEPS when the horizon n_steps is
+        unknown or exceeded. X, V, A, C are views on the recorded steps,
+        disabled channels are None and are never evaluated.
+
+        To initialize a recorder
+
+        TrajectoryRecorder(n_vehicles, n_steps)
+
+    """
+
+    def __init__(
+        self,
+        n_vehicles: int,
+        n_steps: int = None,
+        chunk: int = CHUNK_STEPS,
+        policy: RecordingPolicy = None,
+        columns: np.ndarray = None,
+    ) -> None:
+        self.policy = policy if policy is not None else RecordingPolicy()
+        self.columns = columns
+        self.n_vehicles = n_vehicles if columns is None else len(columns)
+        self.chunk = chunk
+        self.n = 0  # Recorded steps
+        self.step = 0  # Offered steps
+        size = self.policy.n_records(n_steps) if n_steps else chunk
+        self._buffers = {ch: np.empty((size, self.n_vehicles)) for ch in self.policy.channels}
+        self._steps = np.empty(size, dtype=int)
+
+    @classmethod
+    def from_fleet(cls, fleet, n_steps: int = None, policy: RecordingPolicy = None):
+        """
+            Recorder for a FleetState following a recording policy
+        """
+        policy = policy if policy is not None else RecordingPolicy()
+        return cls(len(fleet), n_steps, policy=policy, columns=policy.columns(fleet))
+
+    def __len__(self) -> int:
+        """ Number of recorded steps"""
+        return self.n
+
+    @property
+    def capacity(self) -> int:
+        """
+            Number of steps that fit in the current buffers
+        """
+        return self._steps.shape[0]
+
+    def copy(self) -> "TrajectoryRecorder":
+        """
+            Independent copy of the recorder (branching of a run)
+        """
+        recorder = copy(self)
+        recorder._buffers = {ch: buffer.copy() for ch, buffer in self._buffers.items()}
+        recorder._steps = self._steps.copy()
+        return recorder
+
+    def grow(self) -> None:
+        """
+            Extend buffers by one chunk
+        """
+        for ch, buffer in self._buffers.items():
+            extra = np.empty((self.chunk, self.n_vehicles))
+            self._buffers[ch] = np.concatenate((buffer, extra))
+        self._steps = np.concatenate((self._steps, np.empty(self.chunk, dtype=int)))
+
+    def due(self) -> bool:
+        """
+            Advance the step counter, True when the step has to be recorded
+        """
+        self.step += 1
+        if (self.step - 1) % self.policy.every:
+            return False
+        if self.n == self.capacity:
+            self.grow()
+        self._steps[self.n] = self.step - 1
+        return True
+
+    def store(self, getters: dict, source) -> None:
+        """
+            Store the enabled channels of source for the current record
+        """
+        for ch, buffer in self._buffers.items():
+            value = np.asarray(getters[ch](source))
+            buffer[self.n] = value if self.columns is None else value[self.columns]
+        self.n += 1
+
+    def record(self, x=None, v=None, a=None, control=None) -> None:
+        """
+            Store the state of a single time step
+        """
+        if self.due():
+            self.store(ARRAY_CHANNELS, dict(x=x, v=v, a=a, control=control))
+
+    def record_fleet(self, fleet) -> None:
+        """
+            Store the state of a FleetState
+        """
+        if self.due():
+            fleet.synchronize()  # Sleeping vehicles of the active set
+            self.store(FLEET_CHANNELS, fleet)
+
+    def record_vehicles(self, veh_list: list) -> None:
+        """
+            Store the state of a list of vehicles
+        """
+        if self.due():
+            self.store(VEHICLE_CHANNELS, veh_list)
+
+    def channel(self, name: str) -> np.ndarray:
+        """
+            Recorded values of a channel (T, N), None if not recorded
+        """
+        buffer = self._buffers.get(name)
+        return None if buffer is None else buffer[: self.n]
+
+    @property
+    def time(self) -> np.ndarray:
+        """
+            Recorded step numbers
+        """
+        return self._steps[: self.n]
+
+    @property
+    def X(self) -> np.ndarray:
+        """
+            Positions (T, N)
+        """
+        return self.channel("x")
+
+    @property
+    def V(self) -> np.ndarray:
+        """
+            Speeds (T, N)
+        """
+        return self.channel("v")
+
+    @property
+    def A(self) -> np.ndarray:
+        """
+            Accelerations (T, N)
+        """
+        return self.channel("a")
+
+    @property
+    def C(self) -> np.ndarray:
+        """
+            Desired speeds (T, N)
+        """
+        return self.channel("control")
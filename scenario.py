@@ -6,6 +6,8 @@
 # Imports
 # ==============================================================================
 
+import json
+
 import numpy as np
 
 from network import TrafficNetwork
@@ -13,6 +15,10 @@ from demand import TrafficDemand, Demand
 
 from carfollow import K_X, W_I, U_I
 from carfollow import Tampere
+from fleet import FleetState, NO_LEADER
+from kernels import DEFAULT_BACKEND
+from noise import NoiseSource
+from streams import spawn_streams
 
 # ==============================================================================
 # Constants
@@ -21,8 +27,21 @@ from carfollow import Tampere
 C = U_I * W_I * K_X / (U_I + W_I) * 3600  # veh /h
 T_SIM = 720
 MPR = 0.5
-
-np.random.seed(42)  # Reproducibility MPR
+SEED = 42  # Reproducibility (demand, MPR, noise)
+META_SUFFIX = ".json"  # Snapshot settings (seed, MPR) next to the .npy
+
+# Initial state of a scenario, one row per vehicle (leaders first in each lane)
+STATE_DTYPE = np.dtype(
+    [
+        ("idx", int),
+        ("link", int),
+        ("lane", int),
+        ("x", float),
+        ("v", float),
+        ("type", "U3"),
+        ("leader", int),  # Row of the leader, -1 for lane heads
+    ]
+)
 
 # Initializing vehicles
 Tampere.reset()
@@ -49,69 +68,118 @@ traffic_demand = TrafficDemand(**trf_dmd)
 
 
 class Scenario:
+    """ Initial state of a traffic network loaded with a demand
+
+        The state is built as a structured array (STATE_DTYPE), vehicle
+        objects are only created with vehicles=True or build_vehicles.
+
+        Scenario().save("case.npy")  # case.npy and case.npy.json (seed, MPR)
+        Scenario.load("case.npy").fleet()  # Memory mapped, no demand draw
+    """
+
     def __init__(
         self,
         traffic_network=traffic_network,
         traffic_demand=traffic_demand,
         mpr=MPR,
+        seed=SEED,
+        vehicles: bool = False,
     ):
         self.network = traffic_network
         self.demand = traffic_demand
         self.mpr = mpr
-        self.link_demand_network()
-
-    def link_demand_network(self):
-        """ This will register cars within the traffic network"""
-
-        # create vehicles
+        self.seed = seed
+        self.streams = spawn_streams(seed)  # demand, cav, accept, noise
+        self.state = self.build_state()
+        if vehicles:
+            self.build_vehicles()
+
+    @classmethod
+    def load(cls, filename: str, traffic_network=traffic_network, mmap: bool = True) -> "Scenario":
+        """ Scenario from a snapshot saved with save (read-only when memory mapped)"""
+        scenario = cls.__new__(cls)
+        scenario.network = traffic_network
+        scenario.demand = None
+        try:
+            with open(filename + META_SUFFIX) as meta:
+                settings = json.load(meta)
+        except FileNotFoundError:
+            settings = dict(mpr=None, seed=None)
+        scenario.mpr = settings["mpr"]
+        seed = settings["seed"]
+        scenario.seed = tuple(seed) if isinstance(seed, list) else seed
+        scenario.streams = spawn_streams(scenario.seed)
+        scenario.state = np.load(filename, mmap_mode="r" if mmap else None)
+        return scenario
+
+    def save(self, filename: str) -> None:
+        """ Save the initial state as a .npy snapshot, seed and MPR next to it"""
+        np.save(filename, self.state)
+        seed = self.seed if self.seed is None or np.isscalar(self.seed) else list(self.seed)
+        with open(filename + META_SUFFIX, "w") as meta:
+            json.dump(dict(seed=seed, mpr=self.mpr), meta)
+
+    def __len__(self) -> int:
+        """ Number of vehicles"""
+        return len(self.state)
+
+    def build_state(self) -> np.ndarray:
+        """ Initial state of all links as a structured array"""
+        if self.seed is None:
+            positions = self.demand.positions(rng=self.streams["demand"])
+        else:
+            positions = self.demand.positions(seed=self.seed)  # Memoized
+
+        blocks = []
+        offset = 0
         for lk in self.network.link_order:
-            dmd = self.demand[lk]
-            if dmd:
-                N_veh = len(dmd)
-                V_class = self.get_vehicle_class_per_link(N_veh)
-                X_0 = np.flip(self.demand[lk].full_positions)
-                V_0 = np.ones(N_veh) * U_I
-                veh_0 = self.get_ic_vehicles_per_lane(X_0, V_0, V_class, lk)
-                self.generate_vehicle_list(veh_0, lk)
-
-    def get_vehicle_class_per_link(self, N):
-        """ Generaate vehicles """
-        id_cav = np.random.randint(
-            Tampere.lid, Tampere.lid + N - 1, int(N * self.mpr)
-        )  # Id Connected Vehicles
-        d_class = {k: "CAV" for k in id_cav}
-        v_class = tuple(
-            d_class.get(i, "HDV") for i in range(N)
-        )  # All vehicle types
-        return v_class
-
-    def get_ic_vehicles_per_lane(
-        self, X_0: np.array, V_0: np.array, V_class: tuple, link: int
-    ):
-        """ Retrieve intial condition vehicle state per lane"""
-        n_lanes = len(self.network[link])
-        veh_0 = {}
-        for i, ln in enumerate(self.network[link]):
-            veh_0[ln] = (X_0[i::n_lanes], V_0[i::n_lanes], V_class[i::n_lanes])
-        return veh_0
-
-    def generate_vehicle_list(self, veh_0: dict, link: int):
-        """
-            Generate veh_list 
-        """
-        # Iterate over all lanes
-        for ln in self.network[link].lane_order:
-
-            # Iterate over all vehicles
-            for x, v, vtype in zip(*veh_0[ln]):
-                self.network[link][ln].veh_list.append(
-                    Tampere(x0=x, v0=v, l0=ln, veh_type=vtype)
-                )
-
-            N_veh_lane = len(self.network[link][ln].veh_list)
-
-            # Setting leader for vehicle i
-            for i in range(1, N_veh_lane):
-                self.network[link][ln].veh_list[i].set_leader(
-                    self.network[link][ln].veh_list[i - 1]
-                )
+            if lk in positions:
+                blocks.append(self.link_state(np.flip(positions[lk]), lk, offset))
+                offset += len(blocks[-1])
+        state = np.concatenate(blocks) if blocks else np.zeros(0, STATE_DTYPE)
+        state["idx"] = np.arange(len(state))
+        return state
+
+    def link_state(self, X_0: np.ndarray, link: int, offset: int = 0) -> np.ndarray:
+        """ Initial state of a link, vehicles are dealt to lanes in turn"""
+        N = len(X_0)
+        cav = np.zeros(N, dtype=bool)
+        cav[self.streams["cav"].integers(0, max(N - 1, 1), int(N * self.mpr))] = True
+
+        lanes = np.array(self.network[link].lane_order)
+        order = np.argsort(np.arange(N) % len(lanes), kind="stable")  # Lane by lane
+        lane_rank = order % len(lanes)
+        head = np.concatenate(([True], lane_rank[1:] != lane_rank[:-1]))
+
+        block = np.zeros(N, STATE_DTYPE)
+        block["link"] = link
+        block["lane"] = lanes[lane_rank]
+        block["x"] = X_0[order]
+        block["v"] = U_I
+        block["type"] = np.where(cav[order], "CAV", "HDV")
+        block["leader"] = np.where(head, NO_LEADER, offset + np.arange(N) - 1)
+        return block
+
+    def fleet(self, backend: str = DEFAULT_BACKEND) -> FleetState:
+        """ Fleet of the whole network"""
+        fleet = FleetState(
+            self.state["x"],
+            self.state["v"],
+            veh_type=self.state["type"],
+            leader=self.state["leader"],
+            backend=backend,
+        )
+        fleet.idx = np.array(self.state["idx"])
+        fleet.noise = NoiseSource(len(fleet.followers), rng=self.streams["noise"])
+        return fleet
+
+    def build_vehicles(self) -> None:
+        """ Register vehicle objects in the lanes of the network"""
+        vehicles = []
+        for row in self.state:
+            veh = Tampere(x0=row["x"], v0=row["v"], l0=int(row["lane"]), veh_type=str(row["type"]))
+            veh.rng = self.streams["noise"]
+            if row["leader"] != NO_LEADER:
+                veh.set_leader(vehicles[row["leader"]])
+            self.network[int(row["link"])][int(row["lane"])].veh_list.append(veh)
+            vehicles.append(veh)
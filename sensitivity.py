@@ -1,15 +1,34 @@
-""" 
-    Run sensitivity test 
+"""
+    Run sensitivity test
+
+    python sensitivity.py
+
+    Every (MPR, MIN_DIST, Q) case of General.ipynb runs in a process pool
+    without notebook kernels, the indicators are written to the store.
 """
 
 # ==============================================================================
 # Imports
 # ==============================================================================
 
-import papermill as pm
+import os
+from concurrent.futures import ProcessPoolExecutor
 from itertools import product
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+from carfollow import K_X, U_I, W_I
+from fleet import FleetState, simulate
+from indicators import time_to_collision, travel_time_statistics
+from manifest import record_outputs
+from messages import ACCEPT_MARGIN, MessageScheduler, Msg2
+from noise import NoiseSource
+from phem import PhemExporter
+from recorder import RecordingPolicy
+from store import STORE, IndicatorStore
+from streams import spawn_streams
+from support import tabulated_speed_pulse
 
 # ==============================================================================
 # Constants
@@ -19,16 +38,125 @@ Q = (0.3, 0.5, 0.75, 1)
 MIN_DIST = (5000, 7500, 10000)
 MPR = (0, 0.1, 0.2, 0.3, 0.4)
 
+# Case settings (General.ipynb)
+N = 100  # Number of vehicles to simulate
+T_TOTAL = 960  # Simulation time [s]
+X_CONGESTION = 15000  # Position of congestion in space [m]
+L_CONGESTION = 1500  # Approximate congestion length in space [m]
+PERCEP_RADIOUS = 3000  # Radious of perception of the broadcasted messages [m]
+SEED = 42  # Same streams in every case (common random numbers)
+C = (U_I * W_I * K_X) / (W_I + U_I)  # Capacity per lane [veh/s]
+
+COLUMNS = ("mpr", "q", "distance", "seed", "meanTT", "stdTT", "totalTT", "TTC")
+ARTIFACTS = (("phem", "csv"), ("xva", "npz"), ("spacing", "csv"))  # (kind, extension)
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def lead_spd(x):
+    """  Leader's function to control speed drop in space
+         Speed Drop: 20 m/s
+         Position: 15 Km
+         Duration: 1.5 Km
+    """
+    return tabulated_speed_pulse(drop=20, delay=X_CONGESTION, duration=L_CONGESTION)(x)
+
 
-cases = product(MPR, MIN_DIST, Q)
-list_cases = list(product(MPR, MIN_DIST, Q))
+def simulate_case(
+    mpr: float, min_dist: float, q_perc: float, seed=SEED, send_message=Msg2, observers: tuple = ()
+):
+    """
+        Trajectories (X, V, A) of a case, same draws as General.ipynb
+    """
+    streams = spawn_streams(seed)
+    x0 = np.flip(np.arange(0, N) * (W_I + U_I) / (W_I * K_X) * 1 / q_perc)
+    id_cav = streams["cav"].integers(1, N - 1, int(N * mpr))
+    v_class = np.where(np.isin(np.arange(N), id_cav), "CAV", "HDV")
 
+    d_accept = X_CONGESTION - 1000 - streams["accept"].exponential(PERCEP_RADIOUS, N * 1000)
+    d_accept = d_accept[(d_accept > min_dist) & (d_accept < X_CONGESTION)]
+    d_accept = streams["accept"].choice(d_accept, N)
 
-for case in cases:
-    mpr, min_dist, q = case
-    print(case)
-    pm.execute_notebook(
-        "general.ipynb",
-        "general.ipynb",
-        parameters=dict(MPR=mpr, MIN_DIST=min_dist, Q_PERC=q),
+    fleet = FleetState(x0, U_I, veh_type=v_class)
+    fleet.noise = NoiseSource(N - 1, rng=streams["noise"])
+
+    d_fix = X_CONGESTION - 1000
+    scheduler = MessageScheduler()
+    id_hdv = np.flatnonzero(fleet.type == "HDV")
+    scheduler.register(id_hdv, send_message(d_fix).tabulated, position=d_fix - ACCEPT_MARGIN)
+    id_cav = np.flatnonzero(fleet.type == "CAV")
+    d_cav = d_accept[fleet.idx[id_cav]]
+    msg_cav = [send_message(d).tabulated for d in d_cav]
+    scheduler.register(id_cav, msg_cav, position=d_cav - ACCEPT_MARGIN)
+
+    recorder = simulate(
+        fleet,
+        T_TOTAL,
+        control=lead_spd,
+        policy=RecordingPolicy(),
+        scheduler=scheduler,
+        observers=observers,
     )
+    return recorder.X, recorder.V, recorder.A
+
+
+def run_case(case: tuple, artifacts: str = None, seed=SEED, store: str = None) -> dict:
+    """
+        Indicators of a case (mpr, min_dist, q_perc)
+
+        artifacts: folder where trajectories, PHEM CSV and spacing are
+        written and listed in its manifest, nothing is written when None
+        store: indicator store updated with the case
+    """
+    mpr, min_dist, q_perc = case
+    tag = f"mpr-{mpr}_q-{q_perc}_d-{min_dist}"
+    if artifacts is None:
+        X, V, A = simulate_case(mpr, min_dist, q_perc, seed)
+    else:
+        os.makedirs(artifacts, exist_ok=True)
+        with PhemExporter(os.path.join(artifacts, f"phem_{tag}.csv"), N) as phem:
+            X, V, A = simulate_case(mpr, min_dist, q_perc, seed, observers=(phem,))
+    # Travel times between the leader entrance and the congestion exit
+    tt = travel_time_statistics(X, X[0, 0], X_CONGESTION + L_CONGESTION)
+    ttc = time_to_collision(X, V)
+    indicators = dict(mpr=mpr, q=C * q_perc, distance=min_dist, seed=seed, **tt, TTC=ttc)
+    if store is not None:
+        IndicatorStore(store).upsert(indicators)
+    if artifacts is not None:
+        outputs = {kind: os.path.join(artifacts, f"{kind}_{tag}.{ext}") for kind, ext in ARTIFACTS}
+        np.savez(outputs["xva"], X=X, V=V, A=A)
+        spacing = pd.Series(-np.diff(X, axis=1).mean(axis=1))
+        spacing.to_csv(outputs["spacing"])
+        case = dict(mpr=mpr, q_perc=q_perc, distance=min_dist, seed=seed)
+        record_outputs(artifacts, case, outputs)
+    return indicators
+
+
+def _run_case(args: tuple) -> dict:
+    """ Picklable entry point of the workers"""
+    return run_case(*args)
+
+
+def run_sweep(
+    mpr: tuple = MPR,
+    min_dist: tuple = MIN_DIST,
+    q: tuple = Q,
+    workers: int = None,
+    artifacts: str = None,
+    seed=SEED,
+    store: str = None,
+) -> pd.DataFrame:
+    """
+        Indicators of every case of the grid, computed in a process pool.
+        Workers write their case into the store when given.
+    """
+    cases = list(product(mpr, min_dist, q))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(_run_case, [(case, artifacts, seed, store) for case in cases]))
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+if __name__ == "__main__":
+    print(run_sweep(store=STORE))
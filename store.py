@@ -0,0 +1,112 @@
+"""
+    Indicator store
+
+    Indicators of every run are kept in a SQLite table keyed by
+    (mpr, q, distance, seed, version). Writing a case again replaces its row,
+    several processes can write at once (WAL journal, busy timeout).
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+STORE = "data/indicators.sqlite"
+MODEL_VERSION = 2  # Increase when the model changes the indicators
+KEYS = ("mpr", "q", "distance", "seed", "version")
+VALUES = ("meanTT", "stdTT", "totalTT", "TTC")
+TIMEOUT = 60  # Waiting time for a concurrent writer [s]
+
+# ==============================================================================
+# Clases
+# ==============================================================================
+
+
+class IndicatorStore:
+    """
+        Keyed indicator table
+
+        To write and read indicators
+
+        store = IndicatorStore()
+        store.upsert(dict(mpr=0.1, q=0.24, distance=5000, seed=42, meanTT=...))
+        store.read(columns=("q", "meanTT"), mpr=0.1)
+
+    """
+
+    def __init__(self, filename: str = STORE) -> None:
+        self.filename = filename
+        folder = os.path.dirname(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            columns = ", ".join([f"{key} NOT NULL" for key in KEYS] + [f"{v} REAL" for v in VALUES])
+            db.execute(
+                f"CREATE TABLE IF NOT EXISTS indicators ({columns}, PRIMARY KEY ({', '.join(KEYS)}))"
+            )
+
+    @contextmanager
+    def connect(self):
+        """
+            Connection committed on success and closed on exit
+        """
+        db = sqlite3.connect(self.filename, timeout=TIMEOUT)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def upsert(self, rows, version: int = MODEL_VERSION) -> int:
+        """
+            Insert or replace indicator rows (dict or list of dicts), rows
+            without version get the current model version
+        """
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        names = KEYS + VALUES
+        records = [
+            tuple(row.get(name, version) if name == "version" else row[name] for name in names)
+            for row in rows
+        ]
+        updates = ", ".join(f"{v} = excluded.{v}" for v in VALUES)
+        query = (
+            f"INSERT INTO indicators ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+            f"ON CONFLICT ({', '.join(KEYS)}) DO UPDATE SET {updates}"
+        )
+        with self.connect() as db:
+            db.executemany(query, records)
+        return len(records)
+
+    def read(self, columns: tuple = KEYS + VALUES, **where) -> pd.DataFrame:
+        """
+            Selected columns of the cases matching where (column=value or
+            column=sequence of values)
+        """
+        unknown = set(columns).union(where) - set(KEYS + VALUES)
+        if unknown:
+            raise ValueError(f"Unknown columns {unknown}, choose among {KEYS + VALUES}")
+        clauses, params = [], []
+        for name, value in where.items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{name} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        query = f"SELECT {', '.join(columns)} FROM indicators"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self.connect() as db:
+            return pd.read_sql_query(query, db, params=params)
+
+    def __len__(self) -> int:
+        """ Number of stored cases"""
+        with self.connect() as db:
+            return db.execute("SELECT COUNT(*) FROM indicators").fetchone()[0]
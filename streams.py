@@ -0,0 +1,35 @@
+"""
+    Random streams
+
+    Every run derives its generators from a single seed through a
+    SeedSequence, so results do not depend on import order and runs in
+    parallel processes reproduce the serial ones.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+import numpy as np
+
+# ==============================================================================
+# Constants
+# ==============================================================================
+
+STREAMS = ("demand", "cav", "accept", "noise")  # Child streams of a run
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def spawn_streams(seed=None, names: tuple = STREAMS) -> dict:
+    """
+        Independent generators {name: np.random.Generator} derived from seed.
+
+        seed: int, sequence of ints (e.g. (seed, case number)) or SeedSequence
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    children = seed.spawn(len(names))
+    return {name: np.random.default_rng(child) for name, child in zip(names, children)}
@@ -0,0 +1,71 @@
+"""
+    Branching sweeps
+
+    Cases that only differ by their messages (MPR, acceptance distance) are
+    identical until the first message of the case is delivered. The common
+    prefix is simulated once and each case continues from a checkpoint taken
+    at its first divergence.
+"""
+
+# ==============================================================================
+# Imports
+# ==============================================================================
+
+from fleet import FleetState
+from messages import MessageScheduler
+from recorder import RecordingPolicy, TrajectoryRecorder
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def branch_sweep(
+    fleet: FleetState,
+    n_steps: int,
+    control=0,
+    shared: MessageScheduler = None,
+    cases: dict = None,
+    policy: RecordingPolicy = None,
+) -> dict:
+    """
+        Run several cases sharing a fleet and the shared scheduler, each case
+        adds its own scheduler {key: MessageScheduler}.
+
+        The trunk runs with the shared events until every case diverged. A
+        checkpoint of the fleet (noise generator included), of the shared
+        events and of the recorder is taken at the first step where an event
+        of a case is due, the case then continues alone from it. Results
+        match independent runs with shared.merge(case).
+
+        Returns {key: TrajectoryRecorder}, the fleet holds the last case.
+    """
+    shared = shared if shared is not None else MessageScheduler()
+    cases = cases if cases is not None else {}
+    recorder = TrajectoryRecorder.from_fleet(fleet, n_steps, policy)
+    pending = dict(cases)
+    branches = []  # (step, fleet checkpoint, shared checkpoint, recorder, keys)
+    for t in range(n_steps):
+        if not pending:
+            break
+        diverged = [key for key, sched in pending.items() if len(sched) and sched.due(fleet, t).any()]
+        if diverged:
+            branches.append((t, fleet.checkpoint(), shared.checkpoint(), recorder.copy(), diverged))
+            for key in diverged:
+                del pending[key]
+        shared.fire(fleet, t)
+        fleet.step_evolution(control=control)
+        recorder.record_fleet(fleet)
+
+    results = {key: recorder for key in pending}  # Never diverged: the trunk is their run
+    for t0, fleet_state, shared_state, trunk, keys in branches:
+        for key in keys:
+            fleet.restore(fleet_state)
+            shared.restore(shared_state)
+            scheduler = shared.merge(cases[key])
+            results[key] = branch = trunk.copy()
+            for t in range(t0, n_steps):
+                scheduler.fire(fleet, t)
+                fleet.step_evolution(control=control)
+                branch.record_fleet(fleet)
+    return {key: results[key] for key in cases}
@@ -1,28 +1,84 @@
 """
-    This script is created to transform files in the data/csv folder into 
-    dri files for Phem. 
+    This script is created to transform files in the data/csv folder into
+    dri files for Phem.
+
+    Each PHEM CSV is split by vehicle in a single pass, files are converted
+    in parallel processes and the .dri files of a case in parallel threads.
 """
 
+# ==============================================================================
+# Imports
+# ==============================================================================
+
 import os
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from glob import glob
+
 import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# Constants
+# ==============================================================================
 
 datadir = "data/csv/"
 destdir = "data/dri/"
-filenames = os.listdir(datadir)
-
-for case, filename in enumerate(filenames):
-    basename = filename.split(".csv")[0]
-    newfiledir = destdir + str(case) + '/' 
-    if not os.path.exists(newfiledir):
-        os.makedirs(newfiledir)
-    df = pd.read_csv(datadir + filename)
-    for idx in df["vehicle number"].unique():
-        wfname = newfiledir + str(idx) + "-" + basename +".dri"
-        wfileobj = open(wfname, "w")
-        wfileobj.write("v2\n")
-        wfileobj.write("<t>,<v>,<grad>\n")
-        wfileobj.write("[s],[km/h],[%]\n")
-        data = df[df["vehicle number"].eq(idx)][["time","speed","road inclination"]].to_numpy()
-        np.savetxt(wfileobj,data,delimiter=",",fmt="%.3f")
-        wfileobj.close()
+PATTERN = "phem_*.csv"  # PHEM exports (PhemExporter)
+DRI_HEADER = "v2\n<t>,<v>,<grad>\n[s],[km/h],[%]\n"
+DRI_COLUMNS = ["time", "speed", "road inclination"]
+
+# ==============================================================================
+# Functions
+# ==============================================================================
+
+
+def write_dri(filename: str, data: np.ndarray) -> None:
+    """
+        Write a .dri file (time, speed, gradient)
+    """
+    with open(filename, "w") as wfileobj:
+        wfileobj.write(DRI_HEADER)
+        np.savetxt(wfileobj, data, delimiter=",", fmt="%.3f")
+
+
+def split_vehicles(df: pd.DataFrame) -> tuple:
+    """
+        Vehicle numbers and their rows (time, speed, gradient) in file order
+    """
+    vehicles = df["vehicle number"].to_numpy()
+    order = np.argsort(vehicles, kind="stable")
+    ids, starts = np.unique(vehicles[order], return_index=True)
+    data = df[DRI_COLUMNS].to_numpy()[order]
+    return ids, np.split(data, starts[1:])
+
+
+def convert_file(args: tuple) -> int:
+    """
+        Write the .dri files of a case, returns the number of vehicles
+    """
+    case, filename, destination, threads = args
+    basename = os.path.basename(filename).split(".csv")[0]
+    newfiledir = os.path.join(destination, str(case))
+    os.makedirs(newfiledir, exist_ok=True)
+    df = pd.read_csv(filename, usecols=["vehicle number"] + DRI_COLUMNS)
+    ids, blocks = split_vehicles(df)
+    names = [os.path.join(newfiledir, f"{idx}-{basename}.dri") for idx in ids]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(write_dri, names, blocks))
+    return len(ids)
+
+
+def convert_all(
+    source: str = datadir, destination: str = destdir, workers: int = None, threads: int = 4
+) -> int:
+    """
+        Convert every PHEM CSV of source, returns the number of .dri files
+    """
+    filenames = sorted(glob(os.path.join(source, PATTERN)))
+    jobs = [(case, filename, destination, threads) for case, filename in enumerate(filenames)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(convert_file, jobs))
+
+
+if __name__ == "__main__":
+    print(f"{convert_all()} dri files written in {destdir}")